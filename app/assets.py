@@ -0,0 +1,140 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from pathlib import Path
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+from compression import acceptable, accepted_encodings
+from images import is_hashed_name
+
+# HTTP caching for images: strong ETags, 304s, single byte ranges and
+# precompressed .br/.gz siblings. Content-hashed files (see
+# images.save_hashed_upload) never change and are marked immutable; anything
+# else must be revalidated, which is a cheap 304 when it has not changed.
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(path: Path, stat_result: os.stat_result):
+    if is_hashed_name(path.name):
+        return f'"{path.stem}"'
+    # a replaced file (update_image) gets a new inode and mtime
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def etag_matches(header: str, etag: str):
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def is_not_modified(request: Request, etag: str, mtime: float):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int):
+    """Return (start, end) for a single "bytes=" range, None to ignore it, or
+    "invalid" when it cannot be satisfied."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+def read_chunks(path: Path, start: int, length: int):
+    with path.open("rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def precompressed_variant(request: Request, path: Path):
+    encodings = accepted_encodings(request.headers.get("accept-encoding", ""))
+    for encoding, suffix in PRECOMPRESSED:
+        if acceptable(encodings, encoding):
+            compressed = path.with_name(path.name + suffix)
+            if compressed.is_file():
+                return encoding, compressed
+    return None, path
+
+
+def file_response(request: Request, path: Path, stat_result: os.stat_result = None):
+    stat_result = stat_result or path.stat()
+    media_type = guess_type(path.name)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+
+    # ranges always refer to the identity encoding, so only full responses
+    # may use a precompressed sibling
+    encoding, body_path = (None, path) if range_header else precompressed_variant(request, path)
+    etag = file_etag(path, stat_result)
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if is_hashed_name(path.name) else REVALIDATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    size = body_path.stat().st_size if encoding else stat_result.st_size
+    status_code, start, length = 200, 0, size
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or etag_matches(if_range, etag)):
+        byte_range = parse_range(range_header, size)
+        if byte_range == "invalid":
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code, length = 206, end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        read_chunks(body_path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that serves through file_response above."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        return file_response(Request(scope), Path(full_path), stat_result)
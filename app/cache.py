@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+from config import CACHE_URL, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE
+
+# every cache made by make_cache, for the metrics collector
+caches = []
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    async def set(self, key: str, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    async def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    async def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "namespace": self.namespace,
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RedisCache:
+    """Same interface as TTLCache, shared between workers through Redis.
+
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, url: str, namespace: str, ttl: float):
+        import redis.asyncio as redis
+
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, key: str):
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str):
+        raw = await self._client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value):
+        await self._client.set(self._key(key), json.dumps(value, default=str), ex=max(1, int(self.ttl)))
+
+    async def delete(self, key: str):
+        await self._client.delete(self._key(key))
+
+    async def clear(self):
+        keys = [key async for key in self._client.scan_iter(match=self._key("*"))]
+        if keys:
+            await self._client.delete(*keys)
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def make_cache(namespace: str, ttl: float, maxsize: int):
+    # CACHE_URL=redis://... shares the cache between workers, otherwise each
+    # worker keeps its own in-process copy
+    if CACHE_URL:
+        cache = RedisCache(CACHE_URL, namespace, ttl)
+    else:
+        cache = TTLCache(namespace, ttl, maxsize)
+    caches.append(cache)
+    return cache
+
+
+class ResponseCache:
+    """Cached endpoint results, keyed by route, scope generations and params.
+
+    Each entry's key embeds the current generation of every scope it depends
+    on ("products", "dashboard", "dashboard:<user id>"...). Invalidating a
+    scope just gives it a new generation, so all entries built on the old one
+    stop being found and age out, without having to enumerate them.
+    """
+
+    GENERATION_TTL = 24 * 3600
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.enabled = ttl > 0
+        self.entries = make_cache("response", ttl, maxsize)
+        self.generations = make_cache("response_generation", self.GENERATION_TTL, maxsize)
+
+    async def generation(self, scope: str):
+        generation = await self.generations.get(scope)
+        if generation is None:
+            # a lost generation must never match entries from an older one
+            generation = time.time_ns()
+            await self.generations.set(scope, generation)
+        return generation
+
+    async def key(self, route: str, scopes: tuple, **params):
+        if not self.enabled:
+            return None
+        generations = [str(await self.generation(scope)) for scope in scopes]
+        return f"{route}|{'.'.join(generations)}|{urlencode(sorted(params.items()))}"
+
+    async def get(self, key: str | None):
+        if key is None:
+            return None
+        return await self.entries.get(key)
+
+    async def set(self, key: str | None, value):
+        if key is not None:
+            await self.entries.set(key, value)
+
+    async def invalidate(self, *scopes: str):
+        if not self.enabled:
+            return
+        for scope in scopes:
+            await self.generations.set(scope, time.time_ns())
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE)
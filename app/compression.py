@@ -0,0 +1,152 @@
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from config import (
+    COMPRESSION_MIN_SIZE,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_TYPES,
+)
+
+# Response compression. Brotli is used when the client accepts it and the
+# optional "brotli" package is installed, gzip otherwise. Only the listed
+# content types are compressed (images and archives are already compressed),
+# bodies smaller than the minimum size are sent as they are, and responses
+# that already carry a Content-Encoding (precompressed assets, see assets.py)
+# or are partial (206) are left alone. Streaming responses such as exports are
+# compressed chunk by chunk.
+#
+# Brotli quality 4 and gzip level 6 are the defaults: for dynamic JSON they
+# give most of the size reduction at a fraction of the CPU of the maximum
+# settings (see benchmarks/compression.py).
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+def accepted_encodings(header: str):
+    """{coding: q} for every coding listed, refused ones (q=0) included."""
+    encodings = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def acceptable(encodings: dict, coding: str):
+    # "*" only stands for the codings the header does not list
+    return encodings.get(coding, encodings.get("*", 0)) > 0
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+        content_types: tuple = COMPRESSION_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.content_types = {content_type.strip() for content_type in content_types}
+
+    def choose_encoding(self, accept_encoding: str):
+        encodings = accepted_encodings(accept_encoding)
+        if brotli is not None and acceptable(encodings, "br"):
+            return "br"
+        if acceptable(encodings, "gzip"):
+            return "gzip"
+        return None
+
+    def compressor(self, encoding: str):
+        if encoding == "br":
+            return BrotliCompressor(self.brotli_quality)
+        return GzipCompressor(self.gzip_level)
+
+    def compressible(self, status: int, headers: MutableHeaders):
+        if status < 200 or status in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        return headers.get("content-type", "").split(";")[0].strip() in self.content_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        start = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            if start is not None:
+                headers = MutableHeaders(raw=list(start["headers"]))
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if self.compressible(start["status"], headers):
+                    headers.add_vary_header("Accept-Encoding")
+                    if more_body:
+                        size = int(headers.get("content-length", self.minimum_size))
+                    else:
+                        size = len(body)
+                    if size >= self.minimum_size:
+                        compressor = self.compressor(encoding)
+                        body = compressor.compress(body)
+                        headers["Content-Encoding"] = encoding
+                        if more_body:
+                            if "content-length" in headers:
+                                del headers["content-length"]
+                        else:
+                            body += compressor.flush()
+                            headers["Content-Length"] = str(len(body))
+                        message = {**message, "body": body}
+                await send({**start, "headers": headers.raw})
+                start = None
+            elif compressor is not None:
+                body = compressor.compress(message.get("body", b""))
+                if not message.get("more_body", False):
+                    body += compressor.flush()
+                message = {**message, "body": body}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,244 @@
+from datetime import date
+from sqlalchemy import Date, case, cast, func, insert, literal_column, select, update
+from sqlalchemy.orm import Session
+from dbservice import User, Product, Sale, SalesDaily
+import rollup
+
+# Plain synchronous queries. Handlers call them through dbservice.run_db so the
+# same code runs on a threadpool Session or inside AsyncSession.run_sync.
+
+
+# users
+
+def get_user(db: Session, username: str):
+    return db.query(User).filter(User.username == username).first()
+
+
+def get_users(db: Session):
+    return db.query(User).all()
+
+
+def create_user(db: Session, username: str, email: str, password: str):
+    db_user = User(username=username, email=email, password=password)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+# products
+
+PRODUCT_FIELDS = ("id", "name", "price", "quantity", "product_image")
+
+
+def get_products(db: Session, after: int | None = None, limit: int = 100, fields=PRODUCT_FIELDS):
+    # keyset pagination on the primary key: only the requested columns and
+    # only one page of rows are read, however large the catalog gets
+    columns = [getattr(Product, field) for field in fields]
+    query = db.query(*columns)
+    if after is not None:
+        query = query.filter(Product.id > after)
+    return query.order_by(Product.id).limit(limit).all()
+
+
+def get_products_by_id(db: Session, ids: list, fields=PRODUCT_FIELDS):
+    """The rows for `ids`, in the order given."""
+    columns = [getattr(Product, field) for field in fields]
+    rows = {row.id: row for row in db.query(*columns).filter(Product.id.in_(ids))}
+    return [rows[pid] for pid in ids if pid in rows]
+
+
+def products_version(db: Session):
+    """(latest updated_at, highest id): changes whenever any product does.
+
+    Products are never deleted, so the highest id tracks inserts; each max()
+    is a single index lookup where a count() would read the whole table.
+    """
+    return db.query(
+        db.query(func.max(Product.updated_at)).scalar_subquery(),
+        db.query(func.max(Product.id)).scalar_subquery(),
+    ).one()
+
+
+def get_product(db: Session, pid: int):
+    return db.query(Product).filter(Product.id == pid).first()
+
+
+def create_product(db: Session, name: str, price: float, quantity: int, product_image: str, user_id: int):
+    db_product = Product(
+        name=name,
+        price=price,
+        quantity=quantity,
+        product_image=product_image,
+        user_id=user_id
+    )
+    db.add(db_product)
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+
+class InsufficientStock(Exception):
+    """A sale or stock adjustment would take a product's quantity below zero."""
+
+    def __init__(self, pid: int):
+        super().__init__(f"insufficient stock for product {pid}")
+        self.pid = pid
+
+
+def update_product(db: Session, pid: int, changes: dict):
+    """Apply the non-null `changes` in one UPDATE.
+
+    `quantity_delta` adjusts the stock relative to its current value in the
+    database, so restocks never overwrite concurrent sales.
+    """
+    values = {field: value for field, value in changes.items() if value is not None and field != "quantity_delta"}
+    stmt = update(Product).where(Product.id == pid)
+    delta = changes.get("quantity_delta")
+    if delta:
+        values["quantity"] = Product.quantity + delta
+        stmt = stmt.where(Product.quantity + delta >= 0)
+    if not values:
+        return get_product(db, pid)
+    row = db.execute(stmt.values(values).returning(Product.id)).first()
+    if row is None:
+        db.rollback()
+        if delta and get_product(db, pid):
+            raise InsufficientStock(pid)
+        return None
+    db.commit()
+    return get_product(db, pid)
+
+
+def reserve_stock(db: Session, pid: int, quantity: int):
+    """Atomically take `quantity` units of a product and return its price.
+
+    The check and the decrement are one conditional UPDATE, so concurrent
+    sales can never oversell; the row stays locked until the caller's
+    transaction ends.
+    """
+    row = db.execute(
+        update(Product)
+        .where(Product.id == pid, Product.quantity >= quantity)
+        .values(quantity=Product.quantity - quantity)
+        .returning(Product.price)
+    ).first()
+    if row is None:
+        if get_product(db, pid) is None:
+            raise ValueError(f"product {pid} does not exist")
+        raise InsufficientStock(pid)
+    return row.price
+
+
+def reserve_stock_bulk(db: Session, demand: dict, batch_size: int = 1000):
+    """Take {pid: quantity} units of many products at once.
+
+    Returns ({pid: price} of the products reserved, {pid: reason} of the
+    others). Per batch_size products: one SELECT ... FOR UPDATE that locks
+    the rows in id order (so concurrent batches cannot deadlock) and tells
+    which exist, then one conditional UPDATE for all of them.
+    """
+    prices, failed = {}, {}
+    pids = sorted(demand)
+    for start in range(0, len(pids), batch_size):
+        chunk = pids[start:start + batch_size]
+        existing = set(db.execute(
+            select(Product.id).where(Product.id.in_(chunk)).order_by(Product.id).with_for_update()
+        ).scalars())
+        wanted = case({pid: demand[pid] for pid in chunk}, value=Product.id)
+        reserved = db.execute(
+            update(Product)
+            .where(Product.id.in_(chunk), Product.quantity >= wanted)
+            .values(quantity=Product.quantity - wanted)
+            .returning(Product.id, Product.price)
+            .execution_options(synchronize_session=False)
+        ).all()
+        prices.update((row.id, row.price) for row in reserved)
+        for pid in chunk:
+            if pid not in prices:
+                failed[pid] = "insufficient stock" if pid in existing else "product does not exist"
+    return prices, failed
+
+
+# sales
+
+def get_sales(db: Session, user_id: int):
+    return db.query(Sale).filter(Sale.user_id == user_id).all()
+
+
+def create_sale(db: Session, sale: dict, user_id: int):
+    price = reserve_stock(db, sale["pid"], sale["stock_quantity"])
+    db_sale = Sale(**sale, user_id=user_id)
+    db.add(db_sale)
+    db.flush()
+    rollup.apply_sale(db, db_sale, price)
+    db.commit()
+    db.refresh(db_sale)
+    return db_sale
+
+
+def create_sales_bulk(db: Session, sales: list, user_id: int, batch_size: int = 1000, all_or_nothing: bool = False):
+    """Insert many sale dicts in one transaction with multi-row INSERTs.
+
+    Stock is taken per product for the whole batch with reserve_stock_bulk.
+    Returns the number inserted and a {position: reason} dict of rejected
+    rows: all rows of a product that does not exist or does not have enough
+    stock for the batch.
+    """
+    demand = {}
+    for sale in sales:
+        demand[sale["pid"]] = demand.get(sale["pid"], 0) + sale["stock_quantity"]
+    prices, failed = reserve_stock_bulk(db, demand, batch_size)
+    rejected = {index: failed[sale["pid"]] for index, sale in enumerate(sales) if sale["pid"] in failed}
+    if rejected and all_or_nothing:
+        db.rollback()
+        return 0, rejected
+    rows = [{**sale, "user_id": user_id} for sale in sales if sale["pid"] in prices]
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(Sale).values(rows[start:start + batch_size]))
+    rollup.apply_sales(db, rows, prices, batch_size)
+    db.commit()
+    return len(rows), rejected
+
+
+# dashboard (reads the sales_daily rollup, see rollup.py)
+
+def period_start(db: Session, granularity: str):
+    """The first day of the day/week/month bucket each rollup row falls in."""
+    if granularity == "day":
+        return SalesDaily.day
+    if db.get_bind().dialect.name == "postgresql":
+        # a literal unit, so GROUP BY matches the selected expression
+        return cast(func.date_trunc(literal_column(f"'{granularity}'"), SalesDaily.day), Date)
+    # SQLite: weeks start on Monday, as date_trunc's do
+    modifiers = ("weekday 0", "-6 days") if granularity == "week" else ("start of month",)
+    return func.date(SalesDaily.day, *modifiers, type_=Date)
+
+
+def dashboard_filter(query, user_id: int, start: date | None, end: date | None):
+    # plain comparisons on the day column: the (user_id, day, pid) primary
+    # key serves any range, only the rows inside it are read
+    query = query.filter(SalesDaily.user_id == user_id)
+    if start is not None:
+        query = query.filter(SalesDaily.day >= start)
+    if end is not None:
+        query = query.filter(SalesDaily.day <= end)
+    return query
+
+
+def sales_per_period(db: Session, user_id: int, start: date | None = None, end: date | None = None, granularity: str = "day"):
+    period = period_start(db, granularity).label('date')
+    query = db.query(period, func.sum(SalesDaily.total_sales).label('total_sales'))
+    return dashboard_filter(query, user_id, start, end).group_by(period).order_by(period).all()
+
+
+def top_products(db: Session, user_id: int, start: date | None = None, end: date | None = None, limit: int = 10):
+    # aggregate and rank on the narrow rollup by id, join the names of the
+    # winners only
+    totals = dashboard_filter(
+        db.query(SalesDaily.pid, func.sum(SalesDaily.total_sales).label('sales_product')),
+        user_id, start, end,
+    ).group_by(SalesDaily.pid).order_by(func.sum(SalesDaily.total_sales).desc(), SalesDaily.pid).limit(limit).subquery()
+    return db.query(
+        totals.c.pid, Product.name, totals.c.sales_product
+    ).join(Product, Product.id == totals.c.pid).order_by(totals.c.sales_product.desc(), totals.c.pid).all()
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+from sqlalchemy import select
+from dbservice import Product, Sale, stream_rows
+from config import EXPORT_BATCH_SIZE
+
+EXPORT_COLUMNS = {
+    "products": (Product, ("id", "name", "price", "quantity", "user_id", "product_image")),
+    "sales": (Sale, ("id", "pid", "stock_quantity", "created_at", "user_id")),
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def export_statement(table: str, user_id: int):
+    model, columns = EXPORT_COLUMNS[table]
+    stmt = select(*[getattr(model, column) for column in columns]).order_by(model.id)
+    # sales are private to their user, products are listed publicly
+    if model is Sale:
+        stmt = stmt.where(Sale.user_id == user_id)
+    return stmt
+
+
+def encode_ndjson(rows, columns):
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows
+    )
+
+
+def encode_csv(rows, columns=None):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def export_stream(table: str, fmt: str, user_id: int):
+    """Yield the table as NDJSON or CSV text, one chunk per batch of rows."""
+    _, columns = EXPORT_COLUMNS[table]
+    encode = encode_csv if fmt == "csv" else encode_ndjson
+    header = encode_csv([columns]) if fmt == "csv" else ""
+    partitions = stream_rows(export_statement(table, user_id), EXPORT_BATCH_SIZE)
+
+    if hasattr(partitions, "__aiter__"):
+        async def chunks():
+            if header:
+                yield header
+            async for rows in partitions:
+                yield encode(rows, columns)
+    else:
+        def chunks():
+            if header:
+                yield header
+            for rows in partitions:
+                yield encode(rows, columns)
+    return chunks()
@@ -0,0 +1,56 @@
+import os
+import server
+from config import (
+    BIND,
+    KEEP_ALIVE,
+    PRELOAD,
+    TIMEOUT,
+    GRACEFUL_TIMEOUT,
+    MAX_REQUESTS,
+    MAX_REQUESTS_JITTER,
+    LOG_LEVEL,
+    ACCESS_LOG,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+)
+
+# gunicorn settings, used by `python server.py` and picked up automatically by
+# the uvicorn-gunicorn image from /app/gunicorn_conf.py (with WORKER_CLASS set
+# in the Dockerfile).
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = BIND
+worker_class = "server.Worker"
+workers = server.worker_count()
+keepalive = KEEP_ALIVE
+backlog = server.listen_backlog()
+preload_app = PRELOAD
+timeout = TIMEOUT
+graceful_timeout = GRACEFUL_TIMEOUT
+max_requests = MAX_REQUESTS
+max_requests_jitter = MAX_REQUESTS_JITTER
+loglevel = LOG_LEVEL
+accesslog = ACCESS_LOG
+errorlog = "-"
+
+
+def when_ready(arbiter):
+    arbiter.log.info(
+        "%d workers (%s loop), keep-alive %ss, backlog %d, preload %s; up to %d database connections",
+        workers, server.LOOP, keepalive, backlog, preload_app, workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW),
+    )
+
+
+def post_fork(arbiter, worker):
+    # a connection opened in the master would be shared by every worker
+    import dbservice
+
+    for engine in dbservice.all_engines():
+        engine.dispose(close=False)
+
+
+def child_exit(arbiter, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
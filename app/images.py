@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import re
+from pathlib import Path
+from uuid import uuid4
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from config import MAX_UPLOAD_BYTES, MAX_UPLOAD_REQUEST_BYTES, UPLOAD_CHUNK_SIZE, THUMBNAIL_SIZES
+
+UPLOAD_DIRECTORY = "static/images"
+THUMBNAIL_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, "thumbs")
+
+logger = logging.getLogger(__name__)
+
+# magic numbers of the image formats we accept
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+MATCHING_EXTENSIONS = {
+    "image/jpeg": (".jpg", ".jpeg"),
+    "image/png": (".png",),
+    "image/gif": (".gif",),
+    "image/webp": (".webp",),
+}
+
+# <hash>.<ext> originals and their <hash>_<size>.webp thumbnails
+HASHED_NAME_LENGTH = 32
+HASHED_NAME_PATTERN = re.compile(r"^[0-9a-f]{%d}(_\d+)?\.(jpg|png|gif|webp)$" % HASHED_NAME_LENGTH)
+
+
+def sniff_image_type(head: bytes):
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def safe_filename(filename: str):
+    # never let a client-supplied name escape the upload directory
+    name = Path(filename or "").name
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    return name
+
+
+def writable_filename(filename: str):
+    """safe_filename for names a client may write to or rename.
+
+    Content-hashed names are reserved: their files are served as immutable
+    and shared by every product that uploaded the same image.
+    """
+    name = safe_filename(filename)
+    if is_hashed_name(name):
+        raise HTTPException(status_code=409, detail="Content-addressed images cannot be replaced, upload a new image instead")
+    return name
+
+
+class UploadLimitMiddleware:
+    """Refuse multipart bodies over MAX_UPLOAD_REQUEST_BYTES before they are parsed.
+
+    Starlette spools the whole multipart body to disk before a handler (and
+    stream_upload) sees it, so the limit has to be applied here: at once from
+    Content-Length, or while the body arrives for chunked requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            return await self.app(scope, receive, send)
+        too_large = JSONResponse({"detail": f"Request larger than {MAX_UPLOAD_REQUEST_BYTES} bytes"}, status_code=413)
+        try:
+            declared = int(headers.get("content-length", "0"))
+        except ValueError:
+            declared = 0
+        if declared > MAX_UPLOAD_REQUEST_BYTES:
+            return await too_large(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_REQUEST_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Request larger than {MAX_UPLOAD_REQUEST_BYTES} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def stream_upload(upload: UploadFile, temp_path: Path):
+    """Stream an upload to `temp_path` in chunks, enforcing type and size.
+
+    Returns the sniffed content type and the SHA-256 of the contents. Disk
+    writes run in the threadpool; on any error the partial file is removed.
+    """
+    buffer = await run_in_threadpool(temp_path.open, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            if content_type is None:
+                content_type = sniff_image_type(chunk)
+                if content_type is None:
+                    raise HTTPException(status_code=415, detail="Unsupported image type")
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Image larger than {MAX_UPLOAD_BYTES} bytes")
+            digest.update(chunk)
+            await run_in_threadpool(buffer.write, chunk)
+        if content_type is None:
+            raise HTTPException(status_code=400, detail="Empty file")
+        await run_in_threadpool(buffer.close)
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(temp_path.unlink, True)
+        raise
+    return content_type, digest.hexdigest()
+
+
+async def save_upload(upload: UploadFile, destination: Path):
+    """Save an upload under `destination` and return its content type.
+
+    The file is written to a temporary name next to the destination and
+    renamed into place only once it is complete, so readers never see a
+    partial image.
+    """
+    temp_path = destination.with_name(f".{destination.name}.{uuid4().hex}.tmp")
+    content_type, _ = await stream_upload(upload, temp_path)
+    # the type is served from the extension (assets.py), so they must agree
+    if destination.suffix.lower() not in MATCHING_EXTENSIONS[content_type]:
+        await run_in_threadpool(temp_path.unlink, True)
+        raise HTTPException(status_code=415, detail=f"A {content_type} image needs a {IMAGE_EXTENSIONS[content_type]} name")
+    await run_in_threadpool(os.replace, temp_path, destination)
+    return content_type
+
+
+async def save_hashed_upload(upload: UploadFile):
+    """Save an upload under a name derived from its contents and return the name.
+
+    Content-hashed files never change, so they are served as immutable (see
+    assets.py); uploading the same image twice stores it once.
+    """
+    temp_path = Path(UPLOAD_DIRECTORY) / f".upload.{uuid4().hex}.tmp"
+    content_type, digest = await stream_upload(upload, temp_path)
+    filename = f"{digest[:HASHED_NAME_LENGTH]}{IMAGE_EXTENSIONS[content_type]}"
+    await run_in_threadpool(os.replace, temp_path, Path(UPLOAD_DIRECTORY) / filename)
+    return filename
+
+
+def is_hashed_name(filename: str):
+    return HASHED_NAME_PATTERN.match(filename) is not None
+
+
+def thumbnail_name(filename: str, size: int):
+    return f"{Path(filename).stem}_{size}.webp"
+
+
+def generate_thumbnails(filename: str):
+    """Write resized WebP variants of an uploaded image (run as a background task)."""
+    from PIL import Image
+
+    os.makedirs(THUMBNAIL_DIRECTORY, exist_ok=True)
+    try:
+        with Image.open(Path(UPLOAD_DIRECTORY) / filename) as image:
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            for size in THUMBNAIL_SIZES:
+                variant = image.copy()
+                variant.thumbnail((size, size))
+                target = Path(THUMBNAIL_DIRECTORY) / thumbnail_name(filename, size)
+                temp_path = target.with_name(f".{target.name}.tmp")
+                variant.save(temp_path, "WEBP", quality=80, method=4)
+                os.replace(temp_path, target)
+    except Exception:
+        # the original image is still served, only the small variants are missing
+        logger.exception("could not generate thumbnails for %s", filename)
+        return False
+    return True
+
+
+def remove_thumbnails(filename: str):
+    for size in THUMBNAIL_SIZES:
+        (Path(THUMBNAIL_DIRECTORY) / thumbnail_name(filename, size)).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    # python images.py  -> backfill thumbnails for images uploaded earlier
+    for path in sorted(Path(UPLOAD_DIRECTORY).iterdir()):
+        if path.is_file() and not path.name.startswith("."):
+            print("thumbnails:" if generate_thumbnails(path.name) else "skipped:", path.name)
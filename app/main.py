@@ -1,32 +1,80 @@
+import asyncio
+import hashlib
+import json
+from contextlib import asynccontextmanager
+from datetime import date, timezone
+from email.utils import formatdate
 from pathlib import Path
+from typing import Literal
 import os
-import shutil
-from uuid import uuid4
-from fastapi import FastAPI, File, Form, HTTPException, Depends, UploadFile, Request
-from fastapi.responses import FileResponse
-from pydantic import Tag
-from sqlalchemy import func
+from fastapi import FastAPI, BackgroundTasks, File, Form, HTTPException, Depends, UploadFile, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import uvicorn
-from dbservice import SessionLocal, User, Product, Sale
+from dbservice import get_session, run_db, pool_status, init_engine, dispose_engine
+import crud
+import rollup
+import search
+from export import EXPORT_COLUMNS, MEDIA_TYPES, export_stream
+from images import (
+    UPLOAD_DIRECTORY,
+    THUMBNAIL_SIZES,
+    UploadLimitMiddleware,
+    generate_thumbnails,
+    remove_thumbnails,
+    safe_filename,
+    save_hashed_upload,
+    save_upload,
+    thumbnail_name,
+    writable_filename,
+)
+from config import PRODUCTS_PAGE_SIZE, PRODUCTS_PAGE_MAX, SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX, DASHBOARD_TOP_PRODUCTS, DASHBOARD_TOP_MAX, SALES_BULK_MAX_ROWS, SALES_BULK_MAX_BYTES, SALES_BULK_MAX_LINE_BYTES, SALES_BULK_BATCH_SIZE, SALES_ROLLUP_RECONCILE_SECONDS, SENTRY_SAMPLING_MODE, SQL_DEBUG, COMPRESSION_ENABLED, HOST, PORT
 from models import *
 from security import *
 from fastapi.middleware.cors import CORSMiddleware
-import sentry_sdk
-from fastapi.staticfiles import StaticFiles
+from assets import CachedStaticFiles, file_response, is_not_modified
+from cache import response_cache
+from responses import ORJSONResponse, model_response
+from tracing import RouteStatsMiddleware, init_sentry
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, instrument_engines, render_metrics
+import server
+import sqldebug
 
-sentry_sdk.init(
-    dsn="https://1587107fcf7b86ca551377cc978a8e9f@o4507324311142400.ingest.us.sentry.io/4507324313239552",
-    traces_sample_rate=1.0,
-    profiles_sample_rate=1.0,
-)
+sentry_enabled = init_sentry()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # connect lazily per worker; the schema itself is managed by migrations.py
+    init_engine()
+    instrument_engines()
+    if SQL_DEBUG:
+        sqldebug.instrument_engines()
+    reconciler = None
+    if SALES_ROLLUP_RECONCILE_SECONDS > 0:
+        reconciler = asyncio.create_task(rollup.reconcile_forever())
+    yield
+    if reconciler is not None:
+        reconciler.cancel()
+    await dispose_engine()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+if SQL_DEBUG:
+    app.add_middleware(sqldebug.SQLDebugMiddleware)
+# inside the metrics middleware, so response sizes are the bytes on the wire
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+if sentry_enabled and SENTRY_SAMPLING_MODE == "dynamic":
+    app.add_middleware(RouteStatsMiddleware, routes=app.routes)
 
-UPLOAD_DIRECTORY = "static/images"
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 origins = [
         "http://127.0.0.1:8000",
@@ -42,25 +90,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-db = SessionLocal()
-
 @app.post("/register", response_model=UserOut)
-def register_user(user: UserRegister):
-    if db.query(User).filter(User.username == user.username).first():
+async def register_user(user: UserRegister, db=Depends(get_session)):
+    if await run_db(db, crud.get_user, user.username):
         raise HTTPException(status_code=400, detail="Username already registered")
-    password = pwd_context.hash(user.password)
-    db_user = User(username=user.username, email=user.email, password=password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    db.close()
+    password = await get_password_hash_async(user.password)
+    db_user = await run_db(db, crud.create_user, user.username, user.email, password)
+    await invalidate_user(db_user.username)
     return db_user
 
 @app.post("/login")
-async def login(form_data: UserLogin):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(form_data: UserLogin, db=Depends(get_session)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -69,166 +113,362 @@ async def login(form_data: UserLogin):
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users")
-def get_all_users():
-    users = db.query(User).all()
-    db.close()
+async def get_all_users(db=Depends(get_session)):
+    users = await run_db(db, crud.get_users)
     return users
 
 @app.post("/products")
-def create_product(
+async def create_product(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     price: float = Form(...),
     quantity: int = Form(...),
     product_image: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user),
+    db=Depends(get_session)
 ):
-    # Save the image to a directory
-    image_filename = f"{uuid4()}_{product_image.filename}"
-    image_path = os.path.join("static/images", image_filename)
-    with open(image_path, "wb") as image_file:
-        image_file.write(product_image.file.read())
+    # Save the image under its content hash so it can be cached forever
+    image_filename = await save_hashed_upload(product_image)
+    background_tasks.add_task(generate_thumbnails, image_filename)
 
     # Create and save the product to the database
-    db_product = Product(
-        name=name,
-        price=price,
-        quantity=quantity,
-        product_image=image_filename,
-        user_id=current_user.id
+    db_product = await run_db(
+        db, crud.create_product, name, price, quantity, image_filename, current_user.id
     )
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    db.close()
+    await response_cache.invalidate("products")
 
     return db_product
 
-@app.get('/products', response_model=list[ProductModel])
-def fetch_products(request: Request):
-    try:
-        products = db.query(Product).all()
-        print("products.......", products)
-        products_with_images = []
-        for product in products:
-            image_filename = product.product_image  # assuming product_image is the filename in the database
-            base_url = str(request.base_url)
-            image_url = f"{base_url.rstrip('/')}/static/images/{image_filename}"
-            print("Image URL:", image_url)
-            products_with_images.append(ProductModel(
-                id=product.id,
-                name=product.name,
-                quantity=product.quantity,
-                price=product.price,
-                product_image=image_url  # matching the field name expected by your React component
-            ))
-        return products_with_images
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get('/products', response_model=list[ProductListItem])
+async def fetch_products(
+    request: Request,
+    response: Response,
+    after: int | None = None,
+    limit: int = Query(PRODUCTS_PAGE_SIZE, ge=1, le=PRODUCTS_PAGE_MAX),
+    fields: str | None = None,
+    db=Depends(get_session)
+):
+    # ?fields=name,price selects only those columns (id is always returned,
+    # it is the pagination cursor)
+    selected = list(crud.PRODUCT_FIELDS)
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(requested) - set(crud.PRODUCT_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        selected = ["id"] + [field for field in crud.PRODUCT_FIELDS if field in requested and field != "id"]
+    # conditional GET: a polling client that is up to date costs two index
+    # lookups (see crud.products_version) instead of a page of rows
+    updated_at, last_id = await run_db(db, crud.products_version)
+    version = f"{updated_at.isoformat() if updated_at else '-'}|{last_id}|{after}|{limit}|{','.join(selected)}"
+    etag = f'W/"{hashlib.sha1(version.encode()).hexdigest()[:20]}"'
+    last_modified = updated_at.replace(tzinfo=timezone.utc).timestamp() if updated_at else 0
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if updated_at:
+        response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if is_not_modified(request, etag.removeprefix("W/"), last_modified):
+        return Response(status_code=304, headers=dict(response.headers))
+
+    # keyed on the same version as the ETag: a write made by another worker
+    # changes the version here even before this worker's generation moves,
+    # so a new ETag never goes out with a cached old page
+    cache_key = await response_cache.key("products", ("products",), version=version)
+    rows = await response_cache.get(cache_key)
+    if rows is None:
+        try:
+            rows = [row._asdict() for row in await run_db(db, crud.get_products, after, limit, selected)]
+        except Exception as e:
+            await run_db(db, Session.rollback)
+            raise HTTPException(status_code=500, detail=str(e))
+        await response_cache.set(cache_key, rows)
+
+    base_url = str(request.base_url).rstrip('/')
+    products = [product_item(row, base_url) for row in rows]
+
+    # a full page means there may be more: hand the client the next cursor
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    # already plain JSON types, the response_model would only re-validate them
+    return ORJSONResponse(products, headers=dict(response.headers))
+
+def product_item(row: dict, base_url: str):
+    product = dict(row)
+    if "product_image" in product:
+        filename = product["product_image"]
+        # matching the field name expected by your React component
+        product["product_image"] = f"{base_url}/static/images/{filename}"
+        if filename:
+            product["thumbnail"] = f"{base_url}/static/images/thumbs/{thumbnail_name(filename, THUMBNAIL_SIZES[0])}"
+    return product
+
+@app.get('/products/search', response_model=list[ProductListItem])
+async def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_PAGE_MAX),
+    offset: int = Query(0, ge=0),
+    db=Depends(get_session)
+):
+    # ranked best match first: exact name, prefix, word prefix, substring,
+    # then close spellings (see search.py)
+    cache_key = await response_cache.key("products_search", ("products",), q=" ".join(q.lower().split()), limit=limit, offset=offset)
+    rows = await response_cache.get(cache_key)
+    if rows is None:
+        matches = await run_db(db, search.search_products, q, limit, offset)
+        rows = [row._asdict() for row in await run_db(db, crud.get_products_by_id, [pid for pid, _ in matches])]
+        await response_cache.set(cache_key, rows)
+
+    base_url = str(request.base_url).rstrip('/')
+    products = [product_item(row, base_url) for row in rows]
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(offset + limit)
+    return ORJSONResponse(products, headers=dict(response.headers))
 
 @app.put("/products/{pid}")
-async def update_item(pid: int, product: ProductUpdate, response_model=Product):
-    prod = db.query(Product).filter(Product.id == pid).first()
+async def update_item(pid: int, product: ProductUpdate, background_tasks: BackgroundTasks, db=Depends(get_session)):
+    try:
+        prod = await run_db(db, crud.update_product, pid, product.model_dump())
+    except crud.InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not prod:
         raise HTTPException(status_code=404, detail="product does not exist")
-
-    if product.name is not None:
-        prod.name = product.name
+    await response_cache.invalidate("products", "dashboard")
     if product.price is not None:
-        prod.price = product.price
-    if product.quantity is not None:
-        prod.quantity = product.quantity
-    db.commit()
-    prod = db.query(Product).filter(Product.id == pid).first()
+        background_tasks.add_task(rebuild_product_rollup, pid)
     return prod
 
-@app.get("/sales")
-def get_sales(current_user: User = Depends(get_current_user)):
+async def rebuild_product_rollup(pid: int):
+    await rollup.rebuild_product(pid)
+    await response_cache.invalidate("dashboard")
+
+@app.get("/sales", response_model=list[Sales])
+async def get_sales(current_user: CurrentUser = Depends(get_current_user), db=Depends(get_session)):
     try:
-        sales = db.query(Sale).filter(Sale.user_id == current_user.id).all()
-        db.close()
-        return sales
+        sales = await run_db(db, crud.get_sales, current_user.id)
+        return model_response(list[Sales], sales)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/sales")
-def create_sales(sale: SalesCreate, current_user: User = Depends(get_current_user)):
+@app.post("/sales", response_model=Sales)
+async def create_sales(sale: SalesCreate, current_user: CurrentUser = Depends(get_current_user), db=Depends(get_session)):
     try:
-        db_sale = Sale(**sale.model_dump(), user_id=current_user.id)
-        db.add(db_sale)
-        db.commit()
-        db.refresh(db_sale)
-        return db_sale
+        db_sale = await run_db(db, crud.create_sale, sale.model_dump(), current_user.id)
+        await response_cache.invalidate("products", f"dashboard:{current_user.id}")
+        return model_response(Sales, db_sale)
+    except crud.InsufficientStock as e:
+        await run_db(db, Session.rollback)
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        db.rollback()
-        db.close()
+        await run_db(db, Session.rollback)
         raise HTTPException(status_code=422, detail=str(e))
 
+def validate_sale_row(index, item, rows, errors):
+    try:
+        rows.append((index, SalesCreate.model_validate(item).model_dump()))
+    except ValidationError as e:
+        errors.append({"index": index, "error": e.errors(include_url=False, include_context=False)})
+
+
+def parse_ndjson_lines(lines, first_index):
+    rows, errors = [], []
+    for index, line in enumerate(lines, first_index):
+        try:
+            validate_sale_row(index, json.loads(line), rows, errors)
+        except ValueError:
+            errors.append({"index": index, "error": "invalid JSON"})
+    return rows, errors
+
+
+def parse_json_array(body: bytes):
+    try:
+        items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(items) > SALES_BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"More than {SALES_BULK_MAX_ROWS} rows")
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        validate_sale_row(index, item, rows, errors)
+    return rows, errors
+
+
+async def read_bulk_sales(request: Request):
+    """Validate a JSON array or NDJSON body row by row.
+
+    Returns (index, sale) pairs for the valid rows and per-row errors. The
+    body is limited to SALES_BULK_MAX_BYTES and parsing and validation run
+    in the threadpool; NDJSON is validated a received chunk of lines at a
+    time, so the raw body is never held.
+    """
+    too_large = HTTPException(status_code=413, detail=f"Body larger than {SALES_BULK_MAX_BYTES} bytes")
+    too_many = HTTPException(status_code=413, detail=f"More than {SALES_BULK_MAX_ROWS} rows")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > SALES_BULK_MAX_BYTES:
+        raise too_large
+    content_type = request.headers.get("content-type", "")
+    size = 0
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        rows, errors = [], []
+        count, pending = 0, b""
+
+        async def add_lines(lines):
+            nonlocal count
+            lines = [line for line in lines if line.strip()]
+            if count + len(lines) > SALES_BULK_MAX_ROWS:
+                raise too_many
+            if lines:
+                chunk_rows, chunk_errors = await run_in_threadpool(parse_ndjson_lines, lines, count)
+                rows.extend(chunk_rows)
+                errors.extend(chunk_errors)
+                count += len(lines)
+
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > SALES_BULK_MAX_BYTES:
+                raise too_large
+            *lines, pending = (pending + chunk).split(b"\n")
+            if len(pending) > SALES_BULK_MAX_LINE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Line longer than {SALES_BULK_MAX_LINE_BYTES} bytes")
+            await add_lines(lines)
+        await add_lines([pending])
+        return rows, errors
+    body = bytearray()
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > SALES_BULK_MAX_BYTES:
+            raise too_large
+        body += chunk
+    return await run_in_threadpool(parse_json_array, bytes(body))
+
+@app.post("/sales/bulk", response_model=BulkSalesResult)
+async def create_sales_bulk(request: Request, all_or_nothing: bool = False, current_user: CurrentUser = Depends(get_current_user), db=Depends(get_session)):
+    rows, errors = await read_bulk_sales(request)
+    if errors and all_or_nothing:
+        return JSONResponse(status_code=422, content={"inserted": 0, "errors": errors})
+    sales = [sale for _, sale in rows]
+    try:
+        inserted, rejected = await run_db(db, crud.create_sales_bulk, sales, current_user.id, SALES_BULK_BATCH_SIZE, all_or_nothing)
+    except Exception as e:
+        await run_db(db, Session.rollback)
+        raise HTTPException(status_code=422, detail=str(e))
+    if inserted:
+        await response_cache.invalidate("products", f"dashboard:{current_user.id}")
+    errors += [{"index": rows[position][0], "error": reason} for position, reason in rejected.items()]
+    errors.sort(key=lambda error: error["index"])
+    if errors and all_or_nothing:
+        return JSONResponse(status_code=422, content={"inserted": 0, "errors": errors})
+    return {"inserted": inserted, "errors": errors}
+
 @app.get("/dashboard")
-def dashboard(current_user: User = Depends(get_current_user)):
+async def dashboard(
+    start: date | None = Query(None, alias="from"),
+    end: date | None = Query(None, alias="to"),
+    granularity: Literal["day", "week", "month"] = "day",
+    top: int = Query(DASHBOARD_TOP_PRODUCTS, ge=1, le=DASHBOARD_TOP_MAX),
+    current_user: CurrentUser = Depends(get_current_user),
+    db=Depends(get_session)
+):
+    # ?from=2024-01-01&to=2024-03-31&granularity=week&top=5, both ends
+    # inclusive; without them the user's whole history
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    cache_key = await response_cache.key(
+        "dashboard", ("dashboard", f"dashboard:{current_user.id}"),
+        user=current_user.id, start=start, end=end, granularity=granularity, top=top,
+    )
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
     try:
-        sales_per_day = db.query(
-            func.date(Sale.created_at).label('date'),
-            func.sum(Sale.stock_quantity * Product.price).label('total_sales')
-        ).join(Product).group_by(
-            func.date(Sale.created_at)
-        ).filter(Sale.user_id == current_user.id).all()
+        sales_per_period = await run_db(db, crud.sales_per_period, current_user.id, start, end, granularity)
 
-        sales_data = [{'date': str(day), 'total_sales': sales} for day, sales in sales_per_day]
+        sales_data = [{'date': str(period), 'total_sales': sales} for period, sales in sales_per_period]
 
-        sales_per_product = db.query(
-            Product.name,
-            func.sum(Sale.stock_quantity*Product.price).label('sales_product')
-        ).join(Sale).group_by(
-            Product.name
-        ).filter(Sale.user_id == current_user.id).all()
+        top_products = await run_db(db, crud.top_products, current_user.id, start, end, top)
 
-        salesproduct_data = [{'name': name, 'sales_product': sales_product} for name, sales_product in sales_per_product]
+        salesproduct_data = [{'pid': pid, 'name': name, 'sales_product': sales_product} for pid, name, sales_product in top_products]
 
-        return {'sales_data': sales_data, 'salesproduct_data': salesproduct_data}
+        result = {'granularity': granularity, 'sales_data': sales_data, 'salesproduct_data': salesproduct_data}
+        await response_cache.set(cache_key, result)
+        return ORJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/export/{table}")
+async def export_table(table: str, format: str = "ndjson", current_user: CurrentUser = Depends(get_current_user)):
+    if table not in EXPORT_COLUMNS:
+        raise HTTPException(status_code=404, detail="Unknown export table")
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    return StreamingResponse(
+        export_stream(table, format, current_user.id),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/health/db-pool")
+def db_pool_metrics():
+    return pool_status()
+
+@app.get("/health/password-hasher")
+def password_hasher_metrics():
+    return hasher_status()
+
 @app.post("/upload-image/")
-async def upload_image(file: UploadFile = File(...)):
-    file_path = Path(UPLOAD_DIRECTORY) / file.filename
+async def upload_image(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    filename = writable_filename(file.filename)
+    file_path = Path(UPLOAD_DIRECTORY) / filename
     try:
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await save_upload(file, file_path)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
-    return {"filename": file.filename}
+    background_tasks.add_task(generate_thumbnails, filename)
+    return {"filename": filename}
 
-@app.get("/images/{filename}", tags=["Images"])
-async def get_image(filename: str):
-    file_path = Path(UPLOAD_DIRECTORY) / filename
-    if file_path.exists():
-        return FileResponse(file_path)
+@app.api_route("/images/{filename}", methods=["GET", "HEAD"], tags=["Images"])
+async def get_image(request: Request, filename: str):
+    file_path = Path(UPLOAD_DIRECTORY) / safe_filename(filename)
+    if await run_in_threadpool(file_path.is_file):
+        return await run_in_threadpool(file_response, request, file_path)
     raise HTTPException(status_code=404, detail="Image not found")
 
 @app.put("/images/{filename}")
-async def update_image(filename: str, new_filename: str = None, file: UploadFile = File(...)):
-    file_path = Path(UPLOAD_DIRECTORY) / filename
+async def update_image(background_tasks: BackgroundTasks, filename: str, new_filename: str = None, file: UploadFile = File(...)):
+    file_path = Path(UPLOAD_DIRECTORY) / writable_filename(filename)
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Image not found")
 
-    new_file_path = Path(UPLOAD_DIRECTORY) / (new_filename if new_filename else filename)
+    new_file_path = Path(UPLOAD_DIRECTORY) / writable_filename(new_filename if new_filename else filename)
     
     if new_file_path != file_path and new_file_path.exists():
         raise HTTPException(status_code=400, detail="New filename already exists")
 
-    with new_file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await save_upload(file, new_file_path)
     
     if new_file_path != file_path:
-        file_path.unlink()
+        await run_in_threadpool(file_path.unlink)
+        background_tasks.add_task(remove_thumbnails, file_path.name)
+    background_tasks.add_task(generate_thumbnails, new_file_path.name)
+    await response_cache.invalidate("products")
 
     return {"filename": new_file_path.name, "message": "Image updated successfully"}
 
-# if __name__ == "__main__":
-#     uvicorn.run(app, host="0.0.0.0", port=8000)
+if __name__ == "__main__":
+    # python main.py: one process for development, see server.py for production
+    uvicorn.run(app, host=HOST, port=PORT, loop=server.LOOP, http=server.HTTP)
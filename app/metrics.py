@@ -0,0 +1,177 @@
+import os
+import time
+from contextvars import ContextVar
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+import cache
+import dbservice
+
+# Prometheus instrumentation, exposed on GET /metrics. With several gunicorn
+# workers set PROMETHEUS_MULTIPROC_DIR so the scrape aggregates all of them.
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency", ["method", "route", "status"],
+)
+# the route is only known after routing, so in-flight requests are per method
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being served", ["method"],
+    multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size", ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216),
+)
+SQL_QUERIES = Histogram(
+    "db_queries_per_request", "SQL statements executed per request", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+SQL_TIME = Histogram(
+    "db_query_seconds_per_request", "Time spent in SQL per request", ["method", "route"],
+)
+SQL_STATEMENTS = Counter("db_queries_total", "SQL statements executed")
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_seconds", "Time to get a pooled connection, waiting or connecting",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# per-request SQL counters; the dict is shared with the threadpool and
+# AsyncSession.run_sync, which both run in a copy of the request context
+request_sql = ContextVar("request_sql", default=None)
+
+
+def route_label(scope):
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("path", "").startswith("/static"):
+        return "/static"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        start = time.perf_counter()
+        status = 500
+        size = 0
+        sql = {"count": 0, "seconds": 0.0}
+        token = request_sql.set(sql)
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            request_sql.reset(token)
+            route = route_label(scope)
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(method, route).observe(size)
+            SQL_QUERIES.labels(method, route).observe(sql["count"])
+            SQL_TIME.labels(method, route).observe(sql["seconds"])
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    SQL_STATEMENTS.inc()
+    sql = request_sql.get()
+    if sql is not None:
+        sql["count"] += 1
+        sql["seconds"] += elapsed
+
+
+def instrument_engines():
+    for engine in dbservice.all_engines():
+        if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+            continue
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+class PoolCollector:
+    """Current pool occupancy, read from dbservice.pool_status at scrape time.
+
+    With `pid` every sample carries a pid label, so the values of the worker
+    answering a multiprocess scrape stay apart from the others'.
+    """
+
+    def __init__(self, pid=None):
+        self.labels, self.values = (["pid"], [str(pid)]) if pid is not None else ([], [])
+
+    def collect(self):
+        if dbservice.engine is None:
+            return
+        status = dbservice.pool_status()
+        for name in ("size", "checked_in", "checked_out", "overflow"):
+            gauge = GaugeMetricFamily(f"db_pool_{name}", f"Connection pool {name.replace('_', ' ')}", labels=self.labels)
+            gauge.add_metric(self.values, status[name])
+            yield gauge
+
+
+class CacheCollector:
+    """Hit/miss counters and sizes of every cache.make_cache cache (`pid` as
+    for PoolCollector)."""
+
+    def __init__(self, pid=None):
+        self.labels, self.values = (["pid"], [str(pid)]) if pid is not None else ([], [])
+
+    def collect(self):
+        labels = ["cache"] + self.labels
+        hits = CounterMetricFamily("cache_hits", "Cache lookups that found an entry", labels=labels)
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that found nothing", labels=labels)
+        size = GaugeMetricFamily("cache_entries", "Entries held in this worker's cache", labels=labels)
+        for item in cache.caches:
+            stats = item.stats()
+            values = [stats["namespace"]] + self.values
+            hits.add_metric(values, stats["hits"])
+            misses.add_metric(values, stats["misses"])
+            if "size" in stats:
+                size.add_metric(values, stats["size"])
+        yield hits
+        yield misses
+        yield size
+
+
+REGISTRY.register(PoolCollector())
+REGISTRY.register(CacheCollector())
+dbservice.checkout_wait_listeners.append(POOL_CHECKOUT_WAIT.observe)
+
+
+def render_metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # pool and cache state lives in each worker's memory: only the worker
+        # answering this scrape can report its own
+        registry.register(PoolCollector(pid=os.getpid()))
+        registry.register(CacheCollector(pid=os.getpid()))
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
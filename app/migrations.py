@@ -0,0 +1,148 @@
+import argparse
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from dbservice import Base, Product, Sale, SalesDaily, init_engine, utcnow
+import rollup
+
+# Versioned schema changes, the only place the schema is created or altered
+# (nothing runs at import or app start). Each migration runs once, in its own
+# transaction, and is recorded in schema_migrations. Usage:
+#
+#     python migrations.py upgrade
+#     python migrations.py status
+
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, server_default=func.now(), nullable=False),
+)
+
+
+def initial_schema(conn):
+    # tables that already exist (databases created before migrations) are kept
+    Base.metadata.create_all(bind=conn)
+
+
+def create_indexes(conn, table, names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(bind=conn, checkfirst=True)
+
+
+def add_hot_path_indexes(conn):
+    # get_sales and the dashboard filter by user and date range, the rollup
+    # rebuilds by date window and by product
+    create_indexes(conn, Sale.__table__, {"ix_sales_user_id_created_at", "ix_sales_created_at", "ix_sales_pid"})
+    create_indexes(conn, Product.__table__, {"ix_products_user_id"})
+    create_indexes(conn, SalesDaily.__table__, {"ix_sales_daily_pid", "ix_sales_daily_day"})
+
+
+def add_product_updated_at(conn):
+    # drives the GET /products ETag; databases created by the initial schema
+    # after the column was added to the model already have it
+    if "updated_at" not in {column["name"] for column in inspect(conn).get_columns("products")}:
+        column_type = DateTime().compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE products ADD COLUMN updated_at {column_type}"))
+        conn.execute(update(Product.__table__).values(updated_at=utcnow()))
+    create_indexes(conn, Product.__table__, {"ix_products_updated_at"})
+
+
+def add_product_name_search(conn):
+    # GET /products/search: trigram GIN for substrings and typos, a btree for
+    # prefixes. SQLite searches an in-memory index instead (search.py).
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (lower(name) gin_trgm_ops)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_name_prefix ON products (lower(name) text_pattern_ops)"))
+
+
+def backfill_sales_rollup(conn):
+    # databases from before the rollup have sales but an empty sales_daily;
+    # fill it here so the dashboard never reads a half-built rollup
+    with Session(bind=conn) as db:
+        if db.query(SalesDaily.user_id).first() is None and db.query(Sale.id).first() is not None:
+            rollup.rebuild(db)
+
+
+NEXT_NAME_REVISION = "(SELECT coalesce(max(name_revision), 0) + 1 FROM products)"
+
+
+def add_product_name_revision(conn):
+    # SQLite's in-memory search index re-reads the products created or renamed
+    # since its last refresh. updated_at is stamped in Python before the write
+    # lock is taken, so it can commit out of order; a trigger runs inside the
+    # writing transaction, and with SQLite's single writer its revisions grow
+    # in commit order. Postgres searches with its own indexes (migration 3).
+    if "name_revision" not in {column["name"] for column in inspect(conn).get_columns("products")}:
+        conn.execute(text("ALTER TABLE products ADD COLUMN name_revision INTEGER"))
+    create_indexes(conn, Product.__table__, {"ix_products_name_revision"})
+    if conn.dialect.name != "sqlite":
+        return
+    conn.execute(update(Product.__table__).where(Product.name_revision.is_(None)).values(name_revision=Product.id))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS products_name_revision_insert AFTER INSERT ON products
+        BEGIN
+            UPDATE products SET name_revision = {NEXT_NAME_REVISION} WHERE id = NEW.id;
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS products_name_revision_update AFTER UPDATE OF name ON products
+        WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE products SET name_revision = {NEXT_NAME_REVISION} WHERE id = NEW.id;
+        END
+    """))
+
+
+MIGRATIONS = [
+    (0, "initial schema", initial_schema),
+    (1, "indexes for sales, products and sales_daily hot paths", add_hot_path_indexes),
+    (2, "products.updated_at for conditional GET /products", add_product_updated_at),
+    (3, "product name search indexes", add_product_name_search),
+    (4, "backfill sales_daily from sales", backfill_sales_rollup),
+    (5, "products.name_revision for the SQLite search index", add_product_name_revision),
+]
+
+
+def applied_versions(conn):
+    metadata.create_all(bind=conn)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def upgrade(bind=None):
+    bind = bind or init_engine()
+    with bind.begin() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with bind.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
+        applied.append(version)
+    return applied
+
+
+def status(bind=None):
+    bind = bind or init_engine()
+    with bind.begin() as conn:
+        done = applied_versions(conn)
+    return [(version, description, version in done) for version, description, _ in MIGRATIONS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        applied = upgrade()
+        print(f"applied: {applied}" if applied else "database is up to date")
+    else:
+        for version, description, done in status():
+            print(f"{version:>4}  {'applied' if done else 'pending':<8} {description}")
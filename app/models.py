@@ -1,5 +1,5 @@
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 
@@ -13,6 +13,15 @@ class ProductModel(BaseModel):
     product_image: Optional[str]= None
     
     
+class ProductListItem(BaseModel):
+    id: int
+    name: str | None = None
+    price: int | None = None
+    quantity: int | None = None
+    product_image: Optional[str] = None
+    thumbnail: Optional[str] = None
+
+
 class ProductBase(ProductModel):
 
     user_id: int 
@@ -22,6 +31,7 @@ class ProductUpdate(BaseModel):
     name: str | None = None
     price: float | None = None
     quantity:int | None = None
+    quantity_delta: int | None = None
     
 
 class ProductupdateOut(ProductUpdate):
@@ -40,7 +50,17 @@ class SalesModel(BaseModel):
 
 
 class SalesCreate(SalesModel):
-    pass
+    stock_quantity: int = Field(gt=0)
+
+
+class BulkSalesError(BaseModel):
+    index: int
+    error: str | list
+
+
+class BulkSalesResult(BaseModel):
+    inserted: int
+    errors: list[BulkSalesError]
 
 
 class Sales(SalesModel):
@@ -63,6 +83,12 @@ class UserOut(BaseModel):
     email: str
 
 
+class CurrentUser(BaseModel):
+    id: int
+    username: str
+    email: str | None = None
+
+
 class UserRegister(UserOut):
    password: str
 
@@ -0,0 +1,4 @@
+#! /usr/bin/env bash
+# Run by the tiangolo/uvicorn-gunicorn-fastapi image before the server starts:
+# apply pending schema migrations once, instead of in every worker.
+python /app/migrations.py upgrade
@@ -0,0 +1,125 @@
+import json
+import sys
+from datetime import date
+from sqlalchemy import event
+from dbservice import SessionLocal, init_engine
+import crud
+import rollup
+import search
+
+# Query-plan regression check. Runs every hot query against DATABASE_URL
+# (a local Postgres or SQLite stand-in), EXPLAINs the SQL it actually sent and
+# exits non-zero when one of them sequentially scans a watched table:
+#
+#     DATABASE_URL=sqlite:///./plans.db python migrations.py upgrade
+#     DATABASE_URL=sqlite:///./plans.db python query_plans.py
+#
+# On Postgres sequential scans are disabled for the check, so a "Seq Scan" in
+# the plan means no index can serve the query at all, regardless of how small
+# the stand-in tables are. The rollup rebuilds only recompute rows from sales,
+# so running the check against a real database is harmless.
+
+WATCHED_TABLES = {"products", "sales", "sales_daily", "users"}
+
+HOT_QUERIES = {
+    "get_user": lambda db: crud.get_user(db, "plan-check"),
+    "get_products_page": lambda db: crud.get_products(db, after=0, limit=100),
+    "products_version": lambda db: crud.products_version(db),
+    "get_sales": lambda db: crud.get_sales(db, 1),
+    "dashboard_sales_per_day": lambda db: crud.sales_per_period(db, 1),
+    "dashboard_sales_per_week": lambda db: crud.sales_per_period(db, 1, date(2024, 1, 1), date(2024, 3, 31), "week"),
+    "dashboard_top_products": lambda db: crud.top_products(db, 1, date(2024, 1, 1), date(2024, 3, 31)),
+    "rollup_rebuild_window": lambda db: rollup.rebuild(db, since=date.today()),
+    "rollup_rebuild_product": lambda db: rollup.rebuild(db, pid=1),
+}
+
+# Postgres-only statements (SQLite searches an in-memory index)
+POSTGRES_QUERIES = {
+    "search_products_prefix": lambda db: search.search_products(db, "co", 20),
+    "search_products_fuzzy": lambda db: search.search_products(db, "coca cola", 20),
+}
+
+
+def search_index_changes(db):
+    index = search.NameIndex()
+    index.seen = 0
+    return index.changes(db)
+
+
+# SQLite-only: what the in-memory search index reads on every search
+SQLITE_QUERIES = {
+    "search_index_changes": search_index_changes,
+}
+
+
+def capture_statements(engine, fn):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        with SessionLocal() as db:
+            fn(db)
+            db.rollback()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def postgres_seq_scans(conn, statement, parameters):
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    found = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in WATCHED_TABLES:
+            found.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return found
+
+
+def sqlite_seq_scans(conn, statement, parameters):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    found = []
+    for row in rows:
+        detail = row[-1].split()
+        # "SCAN sales" is a full table scan, "SCAN sales USING INDEX ..." is not
+        if detail[:1] == ["SCAN"] and len(detail) > 1 and detail[1] in WATCHED_TABLES and "INDEX" not in detail:
+            found.append(detail[1])
+    return found
+
+
+def check_plans():
+    engine = init_engine()
+    explain = postgres_seq_scans if engine.dialect.name == "postgresql" else sqlite_seq_scans
+    queries = dict(HOT_QUERIES)
+    if engine.dialect.name == "postgresql":
+        queries.update(POSTGRES_QUERIES)
+    else:
+        queries.update(SQLITE_QUERIES)
+    failures = []
+    for name, fn in queries.items():
+        for statement, parameters in capture_statements(engine, fn):
+            if not statement.lstrip().upper().startswith(("SELECT", "INSERT", "DELETE", "UPDATE")):
+                continue
+            with engine.connect() as conn:
+                with conn.begin():
+                    tables = explain(conn, statement, parameters)
+                    conn.rollback()
+            if tables:
+                failures.append((name, tables, statement))
+    return queries, failures
+
+
+if __name__ == "__main__":
+    queries, failures = check_plans()
+    for name, tables, statement in failures:
+        print(f"FAIL {name}: sequential scan on {', '.join(sorted(set(tables)))}\n    {' '.join(statement.split())}")
+    if failures:
+        sys.exit(1)
+    print(f"ok: no sequential scans in {len(queries)} hot queries")
@@ -0,0 +1,35 @@
+from functools import lru_cache
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+# JSON encoding. ORJSONResponse is the app's default response class (see
+# main.py). Hot handlers return their payload as a response themselves, which
+# skips FastAPI's jsonable_encoder walk and its response_model validate/
+# serialize round trip:
+#
+#     ORJSONResponse(rows)             plain dicts and lists, encoded by orjson
+#     model_response(list[Sales], objs) ORM objects, read from attributes and
+#                                      written as JSON by pydantic-core directly
+#
+# Keep the response_model on the route anyway, it still documents the schema.
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp):
+    return TypeAdapter(tp)
+
+
+class ModelResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, adapter: TypeAdapter, content, **kwargs):
+        self.adapter = adapter
+        super().__init__(content, **kwargs)
+
+    def render(self, content):
+        return self.adapter.dump_json(self.adapter.validate_python(content, from_attributes=True))
+
+
+def model_response(tp, content, **kwargs):
+    return ModelResponse(type_adapter(tp), content, **kwargs)
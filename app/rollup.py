@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from dbservice import Product, Sale, SalesDaily, session_scope, run_db, init_engine, dispose_engine
+from config import SALES_ROLLUP_RECONCILE_SECONDS, SALES_ROLLUP_RECONCILE_DAYS
+
+# The dashboard reads sales_daily instead of aggregating the whole sales
+# history. create_sale adds each sale to its row as it is recorded, and the
+# reconcile job periodically rebuilds recent days from the sales table so
+# missed or out-of-band writes (and price changes) converge.
+
+logger = logging.getLogger(__name__)
+
+
+def upsert_statement(db: Session, values: dict | list):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    # a list of rows becomes one multi-row INSERT ... ON CONFLICT
+    stmt = dialect_insert(SalesDaily).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[SalesDaily.user_id, SalesDaily.day, SalesDaily.pid],
+        set_={
+            "quantity": SalesDaily.quantity + stmt.excluded.quantity,
+            "total_sales": SalesDaily.total_sales + stmt.excluded.total_sales,
+        },
+    )
+
+
+def add_totals(db: Session, values: dict | list):
+    """Add one or more rows of totals; a list must not repeat a key."""
+    stmt = upsert_statement(db, values)
+    if stmt is not None:
+        db.execute(stmt)
+        return
+    for row_values in values if isinstance(values, list) else [values]:
+        row = db.get(SalesDaily, (row_values["user_id"], row_values["day"], row_values["pid"]))
+        if row is None:
+            db.add(SalesDaily(**row_values))
+        else:
+            row.quantity += row_values["quantity"]
+            row.total_sales += row_values["total_sales"]
+
+
+def apply_sale(db: Session, sale: Sale, price: float | None = None):
+    """Add one sale to its daily rollup row, inside the caller's transaction."""
+    if price is None:
+        price = db.query(Product.price).filter(Product.id == sale.pid).scalar() or 0
+    add_totals(db, {
+        "user_id": sale.user_id,
+        "day": sale.created_at.date(),
+        "pid": sale.pid,
+        "quantity": sale.stock_quantity,
+        "total_sales": sale.stock_quantity * price,
+    })
+
+
+def apply_sales(db: Session, sales: list, prices: dict, batch_size: int = 1000):
+    """Add many sale dicts at once: one multi-row upsert per `batch_size`
+    (user, day, product) totals."""
+    totals = {}
+    for sale in sales:
+        key = (sale["user_id"], sale["created_at"].date(), sale["pid"])
+        quantity, total = totals.get(key, (0, 0))
+        totals[key] = (quantity + sale["stock_quantity"], total + sale["stock_quantity"] * (prices[sale["pid"]] or 0))
+    rows = [
+        {"user_id": user_id, "day": day, "pid": pid, "quantity": quantity, "total_sales": total}
+        for (user_id, day, pid), (quantity, total) in totals.items()
+    ]
+    for start in range(0, len(rows), batch_size):
+        add_totals(db, rows[start:start + batch_size])
+
+
+# pg advisory lock key held by every rebuild: workers (and the rollup CLI)
+# deleting and re-inserting the same rows at once would collide on the key
+ROLLUP_LOCK_KEY = 0x5A1E5DA1
+
+
+def lock_rollup(db: Session, wait: bool = True) -> bool:
+    """Take the rollup lock until the end of the transaction (Postgres only;
+    SQLite already runs one writing transaction at a time)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    if wait:
+        db.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK_KEY)))
+        return True
+    return db.execute(select(func.pg_try_advisory_xact_lock(ROLLUP_LOCK_KEY))).scalar()
+
+
+def rebuild(db: Session, since: date | None = None, pid: int | None = None):
+    """Recompute rollup rows from sales, optionally from a day on or for one product."""
+    lock_rollup(db)
+    remove = delete(SalesDaily)
+    totals = select(
+        Sale.user_id,
+        func.date(Sale.created_at),
+        Sale.pid,
+        func.sum(Sale.stock_quantity),
+        func.sum(Sale.stock_quantity * Product.price),
+    ).join(Product, Product.id == Sale.pid)
+    if since is not None:
+        remove = remove.where(SalesDaily.day >= since)
+        totals = totals.where(Sale.created_at >= datetime.combine(since, datetime.min.time()))
+    if pid is not None:
+        remove = remove.where(SalesDaily.pid == pid)
+        totals = totals.where(Sale.pid == pid)
+    totals = totals.group_by(Sale.user_id, func.date(Sale.created_at), Sale.pid)
+
+    db.execute(remove)
+    db.execute(insert(SalesDaily).from_select(
+        ["user_id", "day", "pid", "quantity", "total_sales"], totals
+    ))
+    db.commit()
+
+
+def reconcile(db: Session, days: int = SALES_ROLLUP_RECONCILE_DAYS):
+    # every worker runs the job; whoever gets the lock does this cycle's
+    # rebuild, the others skip it (the full backfill is migration 4)
+    if not lock_rollup(db, wait=False):
+        db.rollback()
+        return False
+    rebuild(db, since=date.today() - timedelta(days=days))
+    return True
+
+
+async def rebuild_product(pid: int):
+    # after a price change every day that product sold on has a stale total
+    async with session_scope() as db:
+        await run_db(db, rebuild, None, pid)
+
+
+async def reconcile_forever():
+    while True:
+        try:
+            async with session_scope() as db:
+                await run_db(db, reconcile)
+        except Exception:
+            logger.exception("sales rollup reconciliation failed")
+        await asyncio.sleep(SALES_ROLLUP_RECONCILE_SECONDS)
+
+
+if __name__ == "__main__":
+    # python rollup.py  -> full rebuild of sales_daily
+    async def main():
+        init_engine()
+        async with session_scope() as db:
+            await run_db(db, rebuild)
+        await dispose_engine()
+
+    asyncio.run(main())
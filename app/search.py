@@ -0,0 +1,253 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from sqlalchemy import case, func, or_, select, union
+from sqlalchemy.orm import Session
+from dbservice import Product
+from config import SEARCH_CANDIDATES, SEARCH_MIN_SIMILARITY
+
+# Product name search for GET /products/search. Matches are ranked exact name,
+# then name prefix, then word prefix, then substring, then fuzzy (trigram
+# similarity above SEARCH_MIN_SIMILARITY); shorter names first within a tier,
+# the closest spellings first among the fuzzy matches.
+#
+# On Postgres the query runs on lower(name) with the pg_trgm GIN index and a
+# text_pattern_ops btree for prefixes (migration 3). Elsewhere (SQLite) each
+# process keeps an in-memory index of the names instead: sorted names and
+# words for prefixes, word postings and word trigrams for substrings and
+# typos, updated with the products created or renamed since the previous search.
+#
+# At most SEARCH_CANDIDATES prefix and SEARCH_CANDIDATES other matches are
+# ranked, so a query matching most of the catalog costs the same as a narrow
+# one; pages past that are empty.
+
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = range(5)
+
+
+def like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def trigrams(text: str) -> set:
+    """pg_trgm style trigrams: every word padded with two spaces in front, one behind."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def search_products(db: Session, q: str, limit: int, offset: int = 0):
+    """(id, tier) of one page of ranked matches for `q`."""
+    q = " ".join(q.lower().split())
+    if not q:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return postgres_search(db, q, limit, offset)
+    return name_index.search(db, q, limit, offset)
+
+
+def postgres_search(db: Session, q: str, limit: int, offset: int):
+    name = func.lower(Product.name)
+    escaped = like_escape(q)
+    # both candidate sets come from an index and are bounded before ranking; their union is joined to products so that the planner
+    # probes the primary key per candidate rather than filtering every row
+    candidates = select(Product.id).where(name.like(f"{escaped}%", escape="\\")).order_by(name).limit(SEARCH_CANDIDATES)
+    if len(q) >= 3:
+        matches = (
+            select(Product.id)
+            .where(or_(name.like(f"%{escaped}%", escape="\\"), name.op("%")(q)))
+            .limit(SEARCH_CANDIDATES)
+        )
+        candidates = union(candidates, matches)
+    candidates = candidates.subquery("candidates")
+    similarity = func.similarity(name, q)
+    tier = case(
+        (name == q, EXACT),
+        (name.like(f"{escaped}%", escape="\\"), PREFIX),
+        (name.like(f"% {escaped}%", escape="\\"), WORD_PREFIX),
+        (name.like(f"%{escaped}%", escape="\\"), SUBSTRING),
+        else_=FUZZY,
+    )
+    query = (
+        select(Product.id, tier.label("tier"))
+        .join(candidates, candidates.c.id == Product.id)
+        .where(or_(tier < FUZZY, similarity >= SEARCH_MIN_SIMILARITY))
+        .order_by(tier, case((tier == FUZZY, similarity), else_=0).desc(), func.length(name), Product.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    return db.execute(query).all()
+
+
+class NameIndex:
+    def __init__(self):
+        self.seen = None  # name_revision of the last product read
+        self.names = {}
+        self.sorted_names, self.sorted_pids = [], array("i")
+        self.vocabulary, self.postings, self.word_grams = [], {}, {}
+        self.trigram_cache = {}
+        self.lock = threading.Lock()
+
+    def changes(self, db: Session):
+        """The products created or renamed since the last refresh.
+
+        name_revision is assigned in commit order by the triggers of migration
+        5 and sales never touch it, so this is usually one probe of its index
+        that finds nothing.
+        """
+        query = select(Product.id, Product.name, Product.name_revision).order_by(Product.name_revision)
+        if self.seen is not None:
+            query = query.where(Product.name_revision > self.seen)
+        return db.execute(query).all()
+
+    def apply(self, rows):
+        if self.seen is None:
+            return self.build(rows)
+        # a concurrent search may have applied a later refresh already
+        for pid, name, revision in rows:
+            if revision <= self.seen:
+                continue
+            name = " ".join(name.lower().split())
+            if self.names.get(pid) != name:
+                if pid in self.names:
+                    self.remove(pid)
+                self.add(pid, name)
+            self.seen = revision
+
+    def build(self, rows):
+        names = {pid: " ".join(name.lower().split()) for pid, name, _ in rows}
+        order = sorted(names, key=names.__getitem__)
+        postings = {}
+        for pid, name in names.items():
+            for word in set(name.split()):
+                postings.setdefault(word, array("i")).append(pid)
+        word_grams = {}
+        for word in postings:
+            for gram in trigrams(word):
+                word_grams.setdefault(gram, []).append(word)
+        self.sorted_names, self.sorted_pids = [names[pid] for pid in order], array("i", order)
+        self.vocabulary, self.postings, self.word_grams = sorted(postings), postings, word_grams
+        self.names = names
+        self.seen = rows[-1].name_revision if rows else None
+
+    def add(self, pid: int, name: str):
+        self.names[pid] = name
+        position = bisect_right(self.sorted_names, name)
+        self.sorted_names.insert(position, name)
+        self.sorted_pids.insert(position, pid)
+        for word in set(name.split()):
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = array("i")
+                insort(self.vocabulary, word)
+                for gram in trigrams(word):
+                    self.word_grams.setdefault(gram, []).append(word)
+            posting.append(pid)
+
+    def remove(self, pid: int):
+        # words left without products stay in the vocabulary, they match nothing
+        name = self.names.pop(pid)
+        position = bisect_left(self.sorted_names, name)
+        while self.sorted_pids[position] != pid:
+            position += 1
+        del self.sorted_names[position]
+        del self.sorted_pids[position]
+        for word in set(name.split()):
+            self.postings[word].remove(pid)
+
+    def word_trigrams(self, word: str):
+        grams = self.trigram_cache.get(word)
+        if grams is None:
+            grams = self.trigram_cache[word] = frozenset(trigrams(word))
+        return grams
+
+    def words_with_prefix(self, prefix: str):
+        position = bisect_left(self.vocabulary, prefix)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(prefix):
+            yield self.vocabulary[position]
+            position += 1
+
+    def words_containing(self, token: str):
+        if len(token) < 3:
+            return [word for word in self.vocabulary if token in word]
+        # every word containing the token has all of its inner trigrams
+        inner = [token[i:i + 3] for i in range(len(token) - 2)]
+        rarest = min((self.word_grams.get(gram, ()) for gram in inner), key=len)
+        return [word for word in rarest if token in word]
+
+    def similar_words(self, token: str):
+        grams = trigrams(token)
+        counts = {}
+        for gram in grams:
+            for word in self.word_grams.get(gram, ()):
+                counts[word] = counts.get(word, 0) + 1
+        return [word for word, shared in counts.items()
+                if shared / (len(grams) + len(self.word_trigrams(word)) - shared) >= SEARCH_MIN_SIMILARITY]
+
+    def search(self, db: Session, q: str, limit: int, offset: int):
+        # the query runs outside the lock: with DB_ASYNC it yields to the
+        # event loop, whose other searches would then block on the lock. What
+        # the lock covers is pure Python, it keeps searches from reading the
+        # index halfway through an update.
+        rows = self.changes(db)
+        with self.lock:
+            self.apply(rows)
+            return self.ranked(q, limit, offset)
+
+    def ranked(self, q: str, limit: int, offset: int):
+        tokens = q.split()
+        found = {}
+
+        def collect(pids, match, tier, examine=None):
+            tier_found = 0
+            for pid in islice(pids, examine):
+                if tier_found >= SEARCH_CANDIDATES:
+                    break
+                if pid not in found and match(self.names[pid]):
+                    found[pid] = tier
+                    tier_found += 1
+
+        # each tier ranks below the previous one, so lower tiers are only
+        # looked at until the requested page is full
+        position = bisect_left(self.sorted_names, q)
+        while position < len(self.sorted_names) and len(found) < SEARCH_CANDIDATES:
+            name = self.sorted_names[position]
+            if not name.startswith(q):
+                break
+            found[self.sorted_pids[position]] = EXACT if name == q else PREFIX
+            position += 1
+        if len(found) < offset + limit:
+            # all but the last token are whole words: start from the rarest
+            sources = [self.postings.get(token, ()) for token in tokens[:-1]]
+            sources.append([pid for word in self.words_with_prefix(tokens[-1]) for pid in self.postings[word]])
+            collect(min(sources, key=len), lambda name: f" {q}" in f" {name}", WORD_PREFIX)
+        if len(found) < offset + limit and len(q) >= 3:
+            token = max(tokens, key=len)
+            pids = (pid for word in self.words_containing(token) for pid in self.postings[word])
+            collect(pids, lambda name: q in name, SUBSTRING)
+        similarity = {}
+        if len(found) < offset + limit and len(q) >= 3:
+            grams = trigrams(q)
+
+            def close(name):
+                # trigrams are per word, so a name's are the union of its words'
+                other = frozenset().union(*(self.word_trigrams(word) for word in name.split()))
+                shared = len(grams & other)
+                similarity[name] = shared / (len(grams) + len(other) - shared)
+                return similarity[name] >= SEARCH_MIN_SIMILARITY
+
+            # names sharing a close word, of which only the first few thousand
+            # are compared: a word like "cheese" can be in most of the catalog
+            words = (word for token in tokens if len(token) >= 3 for word in self.similar_words(token))
+            collect((pid for word in words for pid in self.postings[word]), close, FUZZY, SEARCH_CANDIDATES * 5)
+
+        def rank(pid):
+            name = self.names[pid]
+            return found[pid], -similarity.get(name, 0), len(name), pid
+
+        return [(pid, found[pid]) for pid in sorted(found, key=rank)[offset:offset + limit]]
+
+
+name_index = NameIndex()
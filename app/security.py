@@ -1,16 +1,29 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated, Union
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
-from dbservice import User, SessionLocal
+from dbservice import get_session, run_db
+from models import CurrentUser
+from cache import make_cache
+from config import (
+    AUTH_TRUST_TOKEN_CLAIMS,
+    USER_CACHE_TTL,
+    USER_CACHE_SIZE,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_MAX_QUEUE,
+)
+import crud
 
 SECRET_KEY = "kivutiken"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+user_cache = make_cache("user", USER_CACHE_TTL, USER_CACHE_SIZE)
 
 
 def verify_password(plain_password, hashed_password):
@@ -21,18 +34,72 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def get_user(username: str):
-    db = SessionLocal()
-    user = db.query(User).filter(User.username == username).first()
-    db.close()
-    return user
+# bcrypt is deliberately slow, so it gets its own small pool instead of the
+# shared threadpool; a burst of logins queues here without starving the rest
+# of the API, and past PASSWORD_HASH_MAX_QUEUE callers are turned away
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+hash_stats = {"pending": 0, "completed": 0, "rejected": 0}
+
+
+async def run_hasher(fn, *args):
+    if hash_stats["pending"] >= PASSWORD_HASH_MAX_QUEUE:
+        hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many authentication requests, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    hash_stats["pending"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, fn, *args)
+    finally:
+        hash_stats["pending"] -= 1
+        hash_stats["completed"] += 1
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await run_hasher(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    return await run_hasher(get_password_hash, password)
+
+
+def hasher_status():
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        **hash_stats,
+    }
+
+
+async def get_user(db, username: str):
+    return await run_db(db, crud.get_user, username)
+
+
+# authenticated principals are cached by username so most requests skip the
+# users lookup; call invalidate_user whenever a user's row changes
+async def get_principal(db, username: str):
+    cached = await user_cache.get(username)
+    if cached is not None:
+        return CurrentUser(**cached)
+    user = await get_user(db, username)
+    if user is None:
+        return None
+    principal = CurrentUser(id=user.id, username=user.username, email=user.email)
+    await user_cache.set(username, principal.model_dump())
+    return principal
+
+
+async def invalidate_user(username: str):
+    await user_cache.delete(username)
 
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
+async def authenticate_user(db, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return False
     return user
 
@@ -56,7 +123,7 @@ async def get_token_auth_header(credentials: HTTPAuthorizationCredentials = Depe
     return credentials.credentials    
 
 
-async def get_current_user(token: Annotated[str, Depends(get_token_auth_header)]):
+async def get_current_user(token: Annotated[str, Depends(get_token_auth_header)], db=Depends(get_session)):
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -69,7 +136,9 @@ async def get_current_user(token: Annotated[str, Depends(get_token_auth_header)]
 
     except JWTError:
         raise HTTPException(status_code=401,detail="invalid token")
-    user = get_user(username)
+    if AUTH_TRUST_TOKEN_CLAIMS and payload.get("uid") is not None:
+        return CurrentUser(id=payload["uid"], username=username)
+    user = await get_principal(db, username)
     if user is None:
         raise HTTPException(status_code=401,detail=" user not found")
     return user
@@ -0,0 +1,119 @@
+import math
+import os
+import sys
+from config import HOST, PORT, WEB_CONCURRENCY, WORKERS_PER_CORE, MAX_WORKERS, WORKER_MEMORY_MB, KEEP_ALIVE, BACKLOG
+
+# Production server entry point:
+#
+#     python server.py
+#
+# runs gunicorn with gunicorn_conf.py and the Worker below: uvicorn on uvloop
+# and httptools, one worker per available CPU (bounded by WORKER_MEMORY_MB of
+# memory each), long keep-alive and a backlog capped at the kernel's
+# somaxconn. The Dockerfile runs the same configuration through the
+# uvicorn-gunicorn image. gunicorn and uvloop do not exist on Windows, where
+# this falls back to uvicorn's own process manager on the asyncio loop.
+#
+# Preloading the app is safe: importing main opens no database connections
+# (engines are created per worker in the lifespan, see dbservice.init_engine)
+# and gunicorn_conf.post_fork drops any engine that was created anyway.
+
+try:
+    import uvloop  # noqa: F401
+    LOOP = "uvloop"
+except ImportError:
+    LOOP = "asyncio"
+try:
+    import httptools  # noqa: F401
+    HTTP = "httptools"
+except ImportError:
+    HTTP = "h11"
+
+try:
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # no gunicorn (Windows)
+    UvicornWorker = None
+
+if UvicornWorker is not None:
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {"loop": LOOP, "http": HTTP, "server_header": False}
+
+
+def cpu_limit():
+    """CPUs this process may use, honouring affinity and a cgroup v2 quota."""
+    count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return count
+
+
+def memory_limit():
+    """Bytes of memory available to the container, or the machine."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge number
+        if value != "max" and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def worker_count():
+    if WEB_CONCURRENCY:
+        return WEB_CONCURRENCY
+    # async workers do not block on I/O, so one per core saturates the CPU;
+    # two at least, so one busy or restarting worker does not stall the app
+    workers = max(2, int(cpu_limit() * WORKERS_PER_CORE))
+    memory = memory_limit()
+    if memory:
+        workers = min(workers, max(1, memory // (WORKER_MEMORY_MB * 1024 * 1024)))
+    if MAX_WORKERS:
+        workers = min(workers, MAX_WORKERS)
+    return workers
+
+
+def listen_backlog():
+    # a larger backlog than net.core.somaxconn is silently truncated
+    try:
+        with open("/proc/sys/net/core/somaxconn") as f:
+            return min(BACKLOG, int(f.read()))
+    except (OSError, ValueError):
+        return BACKLOG
+
+
+def run():
+    if UvicornWorker is None:
+        import uvicorn
+
+        uvicorn.run(
+            "main:app",
+            host=HOST,
+            port=PORT,
+            workers=worker_count(),
+            loop=LOOP,
+            http=HTTP,
+            timeout_keep_alive=KEEP_ALIVE,
+            backlog=listen_backlog(),
+            server_header=False,
+        )
+        return
+    from gunicorn.app.wsgiapp import run as run_gunicorn
+
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn_conf.py")
+    sys.argv = [sys.argv[0], "--config", config_path, "main:app"]
+    run_gunicorn()
+
+
+if __name__ == "__main__":
+    run()
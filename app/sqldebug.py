@@ -0,0 +1,90 @@
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy import event
+import dbservice
+from metrics import route_label
+from config import SQL_DEBUG_STRICT, SQL_BUDGET_DEFAULT, SQL_BUDGETS, SQL_REPEAT_THRESHOLD
+
+# Development/test aid, enabled with SQL_DEBUG=1. Every request records the
+# SQL it runs; a request over its route's statement budget, or one that runs
+# the same statement SQL_REPEAT_THRESHOLD or more times (the N+1 signature),
+# is logged, or raises SQLBudgetExceeded with SQL_DEBUG_STRICT=1 so the test
+# client fails the test. Responses carry an X-SQL-Count header.
+
+logger = logging.getLogger(__name__)
+
+request_statements = ContextVar("request_statements", default=None)
+
+
+class SQLBudgetExceeded(RuntimeError):
+    pass
+
+
+def parse_budgets(spec: str):
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(";"))):
+        route, _, limit = item.rpartition("=")
+        budgets[route.strip()] = int(limit)
+    return budgets
+
+
+budgets = parse_budgets(SQL_BUDGETS)
+
+
+def budget_for(method: str, route: str):
+    return budgets.get(f"{method} {route}", SQL_BUDGET_DEFAULT)
+
+
+def find_problems(method: str, route: str, statements: list):
+    problems = []
+    budget = budget_for(method, route)
+    if len(statements) > budget:
+        problems.append(f"{len(statements)} SQL statements, budget is {budget}")
+    for statement, count in Counter(statements).most_common():
+        if count < SQL_REPEAT_THRESHOLD:
+            break
+        problems.append(f"possible N+1, ran {count} times: {' '.join(statement.split())[:200]}")
+    return problems
+
+
+class SQLDebugMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        statements = []
+        token = request_statements.set(statements)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-count", str(len(statements)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_statements.reset(token)
+        method, route = scope["method"], route_label(scope)
+        problems = find_problems(method, route, statements)
+        if problems:
+            message = f"{method} {route}: " + "; ".join(problems)
+            if SQL_DEBUG_STRICT:
+                raise SQLBudgetExceeded(message)
+            logger.warning(message)
+
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    statements = request_statements.get()
+    if statements is not None:
+        statements.append(statement)
+
+
+def instrument_engines():
+    for engine in dbservice.all_engines():
+        if not event.contains(engine, "before_cursor_execute", record_statement):
+            event.listen(engine, "before_cursor_execute", record_statement)
@@ -0,0 +1,126 @@
+import time
+import sentry_sdk
+from starlette.routing import Match
+from config import (
+    SENTRY_DSN,
+    SENTRY_ENVIRONMENT,
+    SENTRY_SAMPLING_MODE,
+    SENTRY_TRACES_SAMPLE_RATE,
+    SENTRY_PROFILES_SAMPLE_RATE,
+    SENTRY_FAST_SAMPLE_RATE,
+    SENTRY_SLOW_REQUEST_MS,
+    SENTRY_IGNORED_PATHS,
+)
+
+# Sentry sampling.
+#
+# "fixed" mode traces SENTRY_TRACES_SAMPLE_RATE of requests, like a plain
+# traces_sample_rate. "dynamic" mode (the default) decides per route from what
+# that route has been doing lately: routes that are slow (moving average at or
+# above SENTRY_SLOW_REQUEST_MS) or have recently failed are traced in full,
+# fast healthy ones only at SENTRY_FAST_SAMPLE_RATE, so most requests pay no
+# tracing cost at all. In both modes health, metrics and static file requests
+# are never traced, and errors are always reported as events. Profiling (the
+# expensive part) is sampled separately by SENTRY_PROFILES_SAMPLE_RATE.
+
+EWMA_WEIGHT = 0.1
+ERROR_MEMORY = 50  # requests a route stays fully traced after a 5xx
+
+route_stats = {}
+app_routes = []  # the app's routes, set by RouteStatsMiddleware
+
+
+def route_path(scope):
+    """The route template a request matches, "unmatched" when none does.
+
+    Stats are kept per template like metrics.route_label, so arbitrary paths
+    (images, 404s) never add entries. The sampler runs before routing has set
+    scope["route"], so the routes are matched here the way the router will.
+    """
+    route = scope.get("route")
+    if route is None:
+        # like the router: the first full match, else the first partial one
+        # (right path, wrong method)
+        partial = None
+        for candidate in app_routes:
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+            if match == Match.PARTIAL and partial is None:
+                partial = candidate
+        route = route or partial
+    return route.path if route is not None else "unmatched"
+
+
+def route_key(scope):
+    return scope.get("method", "GET"), route_path(scope)
+
+
+class RouteStatsMiddleware:
+    """Keeps a moving average latency and recent-error countdown per route."""
+
+    def __init__(self, app, routes):
+        global app_routes
+        self.app = app
+        app_routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+        # routing sets scope["route"] for API routes, but moves a mount's
+        # prefix into root_path; the others are matched as they arrived
+        request_scope = dict(scope)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            key = route_key(scope if "route" in scope else request_scope)
+            average, errors = route_stats.get(key, (elapsed_ms, 0))
+            average += EWMA_WEIGHT * (elapsed_ms - average)
+            errors = ERROR_MEMORY if status >= 500 else max(errors - 1, 0)
+            route_stats[key] = (average, errors)
+
+
+def dynamic_rate(scope):
+    stats = route_stats.get(route_key(scope))
+    if stats is None:
+        return 1.0
+    average, errors = stats
+    if errors or average >= SENTRY_SLOW_REQUEST_MS:
+        return 1.0
+    return SENTRY_FAST_SAMPLE_RATE
+
+
+def traces_sampler(sampling_context):
+    # keep distributed traces whole
+    if sampling_context.get("parent_sampled") is not None:
+        return float(sampling_context["parent_sampled"])
+    scope = sampling_context.get("asgi_scope") or {}
+    if scope.get("path", "").startswith(SENTRY_IGNORED_PATHS):
+        return 0.0
+    if SENTRY_SAMPLING_MODE == "dynamic":
+        return dynamic_rate(scope)
+    return SENTRY_TRACES_SAMPLE_RATE
+
+
+def init_sentry(**options):
+    if not SENTRY_DSN:
+        return False
+    sentry_sdk.init(
+        dsn=SENTRY_DSN,
+        environment=SENTRY_ENVIRONMENT,
+        traces_sampler=traces_sampler,
+        profiles_sample_rate=SENTRY_PROFILES_SAMPLE_RATE,
+        **options,
+    )
+    return True
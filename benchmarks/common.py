@@ -0,0 +1,71 @@
+"""Shared helpers for the benchmark scripts: boot the app in-process against
+a throwaway SQLite database and seed it with a small dataset."""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench-password"
+
+
+def configure(database_url=None, **env):
+    """Point the app at `database_url` (a temp SQLite file by default) before
+    any app module is imported."""
+    if database_url is None:
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        database_url = f"sqlite:///{workdir}/bench.db"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SALES_ROLLUP_RECONCILE_SECONDS", "0")
+    os.environ.update({key: str(value) for key, value in env.items()})
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+    # main mounts static/ relative to the working directory
+    os.chdir(APP_DIR)
+    return database_url
+
+
+def bench_users(count):
+    return [BENCH_USER] + [f"{BENCH_USER}{i}" for i in range(1, count)]
+
+
+def seed(products=200, sales=2000, days=90, users=1, stock=1000):
+    """Create the schema and `users` users (see bench_users) sharing
+    `products` products and `sales` sales round-robin."""
+    import migrations
+    from dbservice import SessionLocal, User, Product, Sale
+    from security import get_password_hash
+    import rollup
+
+    migrations.upgrade()
+    with SessionLocal() as db:
+        if db.query(User).filter(User.username == BENCH_USER).first():
+            return
+        password = get_password_hash(BENCH_PASSWORD)
+        accounts = [User(username=name, email=f"{name}@example.com", password=password) for name in bench_users(users)]
+        db.add_all(accounts)
+        db.flush()
+        db.add_all(
+            Product(name=f"product {i}", price=10 + i % 90, quantity=stock, user_id=accounts[i % users].id, product_image="cocacola.jpg")
+            for i in range(products)
+        )
+        db.flush()
+        start = datetime.now() - timedelta(days=days)
+        db.add_all(
+            Sale(pid=1 + i % products, stock_quantity=1 + i % 5, user_id=accounts[i % users].id,
+                 created_at=start + timedelta(minutes=i * days * 24 * 60 // max(sales, 1)))
+            for i in range(sales)
+        )
+        db.commit()
+        rollup.rebuild(db)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
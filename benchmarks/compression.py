@@ -0,0 +1,123 @@
+"""Bandwidth vs CPU for response compression on representative payloads.
+
+For each payload and each gzip level / brotli quality, prints the compressed
+size, the CPU time to compress it and the resulting time to deliver it
+(compression + transfer) on a slow and a fast link:
+
+    products_100   a default GET /products page
+    products_1000  the largest page (PRODUCTS_PAGE_MAX)
+    sales_10k      GET /sales for a busy user
+    dashboard      GET /dashboard, 90 days and 200 products
+    export_csv     GET /export/sales?format=csv, 10k rows
+
+    python benchmarks/compression.py
+    python benchmarks/compression.py --links 2,50,1000
+
+The app's defaults are gzip level 6 and brotli quality 4
+(COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY).
+"""
+import argparse
+import csv
+import io
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import common
+
+SETTINGS = [("gzip", 1), ("gzip", 6), ("gzip", 9), ("br", 1), ("br", 4), ("br", 6), ("br", 11)]
+
+
+def payloads():
+    from responses import ORJSONResponse
+
+    base_url = "http://localhost:8000"
+
+    def products(count):
+        return [
+            {
+                "id": i,
+                "name": f"product {i}",
+                "price": 10 + i % 90,
+                "quantity": 1000 - i % 1000,
+                "product_image": f"{base_url}/static/images/{i * 7919:032x}.jpg",
+                "thumbnail": f"{base_url}/static/images/thumbs/{i * 7919:032x}_160.webp",
+            }
+            for i in range(count)
+        ]
+
+    start = datetime(2024, 1, 1)
+    sales = [
+        {"pid": 1 + i % 200, "stock_quantity": 1 + i % 5, "created_at": (start + timedelta(minutes=13 * i)).isoformat(), "id": i, "user_id": 1}
+        for i in range(10000)
+    ]
+    dashboard = {
+        "sales_data": [{"date": str((start + timedelta(days=d)).date()), "total_sales": 1234.5 + d * 17} for d in range(90)],
+        "salesproduct_data": [{"name": f"product {p}", "sales_product": 99.0 * (p % 13 + 1)} for p in range(200)],
+    }
+    export = io.StringIO()
+    writer = csv.writer(export)
+    writer.writerow(["id", "pid", "user_id", "stock_quantity", "created_at"])
+    for sale in sales:
+        writer.writerow([sale["id"], sale["pid"], sale["user_id"], sale["stock_quantity"], sale["created_at"]])
+
+    return {
+        "products_100": ORJSONResponse(products(100)).body,
+        "products_1000": ORJSONResponse(products(1000)).body,
+        "sales_10k": ORJSONResponse(sales).body,
+        "dashboard": ORJSONResponse(dashboard).body,
+        "export_csv": export.getvalue().encode(),
+    }
+
+
+def compress(encoding, level, body):
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(body, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", default="5,100", help="link speeds in Mbit/s, comma separated")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    links = [float(speed) for speed in args.links.split(",")]
+
+    common.configure(SENTRY_DSN="")
+    try:
+        import brotli  # noqa: F401
+        settings = SETTINGS
+    except ImportError:
+        print("brotli is not installed, gzip only")
+        settings = [setting for setting in SETTINGS if setting[0] == "gzip"]
+
+    def transfer_ms(size, mbit):
+        return size * 8 / (mbit * 1000)
+
+    header = f"{'payload':<15}{'setting':<10}{'bytes':>10}{'ratio':>8}{'cpu':>11}"
+    header += "".join(f"{f'@{speed:g}Mbit':>12}" for speed in links)
+    print(header)
+    for name, body in payloads().items():
+        row = f"{name:<15}{'identity':<10}{len(body):>10}{1:>8.2f}{0:>9.2f}ms"
+        print(row + "".join(f"{transfer_ms(len(body), speed):>10.1f}ms" for speed in links))
+        for encoding, level in settings:
+            cpu, compressed = best_of(lambda: compress(encoding, level, body), args.repeat)
+            row = f"{'':<15}{f'{encoding}-{level}':<10}{len(compressed):>10}{len(body) / len(compressed):>8.2f}{cpu:>9.2f}ms"
+            print(row + "".join(f"{cpu + transfer_ms(len(compressed), speed):>10.1f}ms" for speed in links))
+    print("link columns: compression time + transfer time of the body")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Generate a benchmark-scale dataset straight into the app's schema.
+
+Creates --users users (all with --password), --products products pointing at
+a handful of generated placeholder images, and --sales sales spread over the
+last --days days, then rebuilds the sales_daily rollup and refreshes planner
+statistics. Sales follow a realistic shape: a few products sell far more
+than the rest, volume grows over the period, weekends are busier and most
+sales happen during the day.
+
+Sales are generated and loaded in --chunk-size chunks by --processes worker
+processes, each with its own connection: COPY ... FROM STDIN on Postgres,
+batched executemany on SQLite (whose single writer serialises the loading,
+only the generation runs in parallel there). The secondary indexes on sales
+are dropped during the load and rebuilt once at the end.
+
+    python benchmarks/generate_data.py --database-url postgresql://postgres@localhost/bench \\
+        --users 1000 --products 100000 --sales 20000000
+    python benchmarks/generate_data.py --database-url sqlite:///./bench.db --sales 1000000
+
+The same command is safe to run again with another --prefix to add more data.
+"""
+import argparse
+import io
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from itertools import accumulate
+
+import common
+
+ADJECTIVES = ["Fresh", "Classic", "Spicy", "Organic", "Large", "Small", "Diet", "Premium", "Family", "Mini"]
+NOUNS = ["Cola", "Pizza", "Bread", "Milk", "Coffee", "Juice", "Rice", "Soap", "Chips", "Water", "Tea", "Cheese"]
+# share of the day's sales per hour, 00:00 to 23:00
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 11, 12, 11, 10, 10, 11, 12, 12, 10, 8, 5, 3, 2]
+QUANTITY_WEIGHTS = {1: 55, 2: 22, 3: 11, 4: 7, 5: 5}
+
+worker = {}
+
+
+def init_worker(database_url, pids, product_weights, days, day_weights):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    worker["engine"] = create_engine(database_url, poolclass=NullPool)
+    worker["pids"] = pids
+    worker["product_weights"] = list(accumulate(product_weights))
+    worker["days"] = [day.isoformat() for day in days]
+    worker["day_weights"] = list(accumulate(day_weights))
+
+
+def generate_sales(rng, count, user_ids, microseconds):
+    """Column lists for `count` sales; every draw is one C-level choices() call."""
+    pids = rng.choices(worker["pids"], cum_weights=worker["product_weights"], k=count)
+    days = rng.choices(worker["days"], cum_weights=worker["day_weights"], k=count)
+    hours = rng.choices(range(24), weights=HOUR_WEIGHTS, k=count)
+    seconds = [rng.randrange(3600) for _ in range(count)]
+    quantities = rng.choices(list(QUANTITY_WEIGHTS), weights=list(QUANTITY_WEIGHTS.values()), k=count)
+    users = rng.choices(user_ids, k=count)
+    # SQLite stores DateTime as text with microseconds, keep the same format
+    suffix = ".000000" if microseconds else ""
+    created = [
+        f"{day} {hour:02d}:{second // 60:02d}:{second % 60:02d}{suffix}"
+        for day, hour, second in zip(days, hours, seconds)
+    ]
+    return pids, quantities, users, created
+
+
+def load_chunk(seed, count, user_ids):
+    engine = worker["engine"]
+    rng = random.Random(seed)
+    postgres = engine.dialect.name == "postgresql"
+    pids, quantities, users, created = generate_sales(rng, count, user_ids, microseconds=not postgres)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if postgres:
+            buffer = io.StringIO("".join(
+                f"{pid},{quantity},{user},{at}\n" for pid, quantity, user, at in zip(pids, quantities, users, created)
+            ))
+            cursor.copy_expert("COPY sales (pid, stock_quantity, user_id, created_at) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            cursor.execute("PRAGMA busy_timeout = 600000")
+            cursor.executemany(
+                "INSERT INTO sales (pid, stock_quantity, user_id, created_at) VALUES (?, ?, ?, ?)",
+                zip(pids, quantities, users, created),
+            )
+        connection.commit()
+    finally:
+        connection.close()
+    return count
+
+
+def placeholder_images(count, rng):
+    """Write `count` solid-colour JPEGs (and thumbnails) under content-hashed names."""
+    import hashlib
+    from pathlib import Path
+    from PIL import Image
+    from images import HASHED_NAME_LENGTH, UPLOAD_DIRECTORY, generate_thumbnails
+
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    names = []
+    for _ in range(count):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        buffer = io.BytesIO()
+        Image.new("RGB", (640, 640), color).save(buffer, "JPEG", quality=80)
+        name = f"{hashlib.sha256(buffer.getvalue()).hexdigest()[:HASHED_NAME_LENGTH]}.jpg"
+        path = Path(UPLOAD_DIRECTORY) / name
+        if not path.exists():
+            path.write_bytes(buffer.getvalue())
+            generate_thumbnails(name)
+        names.append(name)
+    return names
+
+
+def create_users(conn, prefix, count, password):
+    from sqlalchemy import insert, select
+    from dbservice import User
+
+    if conn.execute(select(User.id).where(User.username == f"{prefix}0")).first():
+        raise SystemExit(f"users named {prefix}* already exist, pick another --prefix")
+    conn.execute(insert(User), [
+        {"username": f"{prefix}{i}", "email": f"{prefix}{i}@example.com", "password": password} for i in range(count)
+    ])
+    return list(conn.execute(select(User.id).where(User.username.like(f"{prefix}%"))).scalars())
+
+
+def create_products(conn, count, user_ids, image_names, rng, batch_size=10000):
+    from sqlalchemy import func, insert, select
+    from dbservice import Product, utcnow
+
+    first = (conn.execute(select(func.max(Product.id))).scalar() or 0) + 1
+    now = utcnow()
+    for start in range(0, count, batch_size):
+        conn.execute(insert(Product), [
+            {
+                "name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}",
+                "price": max(1, round(rng.lognormvariate(3, 0.8))),
+                "quantity": rng.randrange(1000, 100000),
+                "user_id": rng.choice(user_ids),
+                "product_image": image_names[i % len(image_names)],
+                "updated_at": now,
+            }
+            for i in range(start, min(start + batch_size, count))
+        ])
+    return list(conn.execute(select(Product.id).where(Product.id >= first)).scalars())
+
+
+def sales_shape(pids, days, rng):
+    # Zipf-like popularity over a random order of products
+    ranked = list(pids)
+    rng.shuffle(ranked)
+    product_weights = [1 / (rank + 1) ** 1.1 for rank in range(len(ranked))]
+    today = date.today()
+    day_list = [today - timedelta(days=days - 1 - d) for d in range(days)]
+    # growing over the period, busier at weekends, a little noise day to day
+    day_weights = [
+        (1 + 1.5 * d / max(days - 1, 1)) * (1.3 if day.weekday() >= 5 else 1) * rng.uniform(0.85, 1.15)
+        for d, day in enumerate(day_list)
+    ]
+    return ranked, product_weights, day_list, day_weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--sales", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--images", type=int, default=12)
+    parser.add_argument("--prefix", default="gen", help="username prefix")
+    parser.add_argument("--password", default=common.BENCH_PASSWORD)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-indexes", action="store_true", help="do not drop the sales indexes while loading")
+    parser.add_argument("--skip-rollup", action="store_true")
+    args = parser.parse_args()
+
+    common.configure(args.database_url, SENTRY_DSN="")
+    import migrations
+    import rollup
+    from sqlalchemy import text
+    from dbservice import Sale, SessionLocal, init_engine
+    from security import get_password_hash
+
+    rng = random.Random(args.seed)
+    engine = init_engine()
+    migrations.upgrade()
+    started = time.perf_counter()
+
+    image_names = placeholder_images(args.images, rng)
+    with engine.begin() as conn:
+        user_ids = create_users(conn, args.prefix, args.users, get_password_hash(args.password))
+        pids = create_products(conn, args.products, user_ids, image_names, rng)
+    print(f"{len(user_ids)} users, {len(pids)} products, {len(image_names)} images in {time.perf_counter() - started:.1f}s", flush=True)
+
+    indexes = [] if args.keep_indexes else list(Sale.__table__.indexes)
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(bind=conn, checkfirst=True)
+
+    load_started = time.perf_counter()
+    chunks = [(args.seed * 1000003 + n, min(args.chunk_size, args.sales - offset))
+              for n, offset in enumerate(range(0, args.sales, args.chunk_size))]
+    loaded = 0
+    with ProcessPoolExecutor(
+        args.processes, initializer=init_worker,
+        initargs=(args.database_url, *sales_shape(pids, args.days, rng)),
+    ) as pool:
+        for count in pool.map(load_chunk, *zip(*chunks), [user_ids] * len(chunks)):
+            loaded += count
+            elapsed = time.perf_counter() - load_started
+            print(f"\r{loaded}/{args.sales} sales, {loaded / elapsed:,.0f} rows/s", end="", flush=True)
+    print()
+
+    step = time.perf_counter()
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(bind=conn, checkfirst=True)
+    if indexes:
+        print(f"sales indexes rebuilt in {time.perf_counter() - step:.1f}s", flush=True)
+
+    if not args.skip_rollup:
+        step = time.perf_counter()
+        with SessionLocal() as db:
+            rollup.rebuild(db)
+        print(f"sales_daily rebuilt in {time.perf_counter() - step:.1f}s", flush=True)
+
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+        conn.commit()
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""End-to-end load test: latency, throughput and errors per route.
+
+Seeds a database (a throwaway SQLite file, or --database-url for a local
+Postgres) with --users users sharing --products products and --sales sales,
+starts the app with `python server.py`, and runs --concurrency virtual users
+for --duration seconds after a --warmup. Each virtual user logs in once
+(before the clock starts), then keeps picking a request from the weighted
+mix below:
+
+    POST /login              GET /sales               GET /images/{name}
+    GET  /products (pages)   POST /sales              GET /static/images/{name}
+    GET  /dashboard
+
+and the report has count, req/s, error rate and p50/p95/p99 per route.
+
+    python benchmarks/load_test.py --concurrency 32 --duration 30
+    python benchmarks/load_test.py --database-url postgresql://... --users 50 --products 20000 --sales 500000
+    python benchmarks/load_test.py --url http://staging:8000 --users 5   # already running and seeded
+
+Regression check: --save-baseline FILE stores the results, --baseline FILE
+compares against them and exits 1 when a route's p95 is more than
+--tolerance (default 25%) slower, its throughput that much lower, or its
+error rate more than a point higher. benchmarks/baseline.json was recorded
+with the defaults on a 1-CPU container with SQLite; record your own on the
+machine that runs the check.
+
+Uses httpx (installed with the test client) as the load generator.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import common
+
+PORT = 8898
+
+# (route label, weight)
+MIX = [
+    ("POST /login", 0.2),  # bcrypt: a few logins cost more CPU than everything else
+    ("GET /products", 6),
+    ("GET /sales", 2),
+    ("POST /sales", 2),
+    ("GET /dashboard", 3),
+    ("GET /images/{filename}", 2),
+    ("GET /static/images", 2),
+]
+IMAGE = "cocacola.jpg"
+
+
+class VirtualUser:
+    def __init__(self, client, username, products, stats):
+        self.client = client
+        self.username = username
+        self.products = products
+        self.stats = stats
+        self.headers = {}
+
+    async def login(self):
+        response = await self.client.post("/login", json={"username": self.username, "password": common.BENCH_PASSWORD})
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def request(self, route):
+        if route == "POST /login":
+            return await self.login()
+        if route == "GET /products":
+            after = random.randrange(0, max(self.products - 100, 1))
+            return await self.client.get("/products", params={"after": after, "limit": 100})
+        if route == "GET /sales":
+            return await self.client.get("/sales", headers=self.headers)
+        if route == "POST /sales":
+            sale = {"pid": random.randint(1, self.products), "stock_quantity": 1, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            return await self.client.post("/sales", json=sale, headers=self.headers)
+        if route == "GET /dashboard":
+            return await self.client.get("/dashboard", headers=self.headers)
+        if route == "GET /images/{filename}":
+            return await self.client.get(f"/images/{IMAGE}")
+        return await self.client.get(f"/static/images/{IMAGE}")
+
+    async def run(self, deadline, measure_from):
+        routes, weights = zip(*MIX)
+        while time.perf_counter() < deadline:
+            route = random.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await self.request(route)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            if start >= measure_from:
+                self.stats.setdefault(route, []).append(((time.perf_counter() - start) * 1000, failed))
+
+
+def summarize(stats, seconds):
+    results = {}
+    for route, samples in sorted(stats.items()):
+        latencies = [ms for ms, _ in samples]
+        errors = sum(1 for _, failed in samples if failed)
+        results[route] = {
+            "count": len(samples),
+            "rps": len(samples) / seconds,
+            "error_rate": errors / len(samples),
+            "p50": common.percentile(latencies, 50),
+            "p95": common.percentile(latencies, 95),
+            "p99": common.percentile(latencies, 99),
+        }
+    return results
+
+
+def print_results(results):
+    print(f"{'route':<26}{'count':>8}{'req/s':>9}{'errors':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for route, r in results.items():
+        print(f"{route:<26}{r['count']:>8}{r['rps']:>9.1f}{r['error_rate']:>8.1%}"
+              f"{r['p50']:>8.1f}ms{r['p95']:>8.1f}ms{r['p99']:>8.1f}ms")
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for route, base in baseline.items():
+        current = results.get(route)
+        if current is None:
+            regressions.append(f"{route}: no requests")
+            continue
+        if current["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {base['p95']:.1f}ms -> {current['p95']:.1f}ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: throughput {base['rps']:.1f} -> {current['rps']:.1f} req/s")
+        if current["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{route}: error rate {base['error_rate']:.1%} -> {current['error_rate']:.1%}")
+    return regressions
+
+
+async def drive(url, args):
+    import httpx
+
+    stats = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        names = common.bench_users(args.users)
+        users = [VirtualUser(client, names[i % len(names)], args.products, stats) for i in range(args.concurrency)]
+        # the initial logins are not part of the measurement
+        await asyncio.gather(*(user.login() for user in users))
+        measure_from = time.perf_counter() + args.warmup
+        deadline = measure_from + args.duration
+        await asyncio.gather(*(user.run(deadline, measure_from) for user in users))
+    return summarize(stats, args.duration)
+
+
+def wait_until_up(url, process, deadline=60):
+    import httpx
+
+    start = time.time()
+    while time.time() - start < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during start-up")
+        try:
+            if httpx.get(f"{url}/health/db-pool", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url")
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sales", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--workers", type=int, help="WEB_CONCURRENCY for the started server")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the request mix")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare with a baseline JSON file")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    # configure() changes into app/
+    for name in ("output", "baseline", "save_baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    process = None
+    url = args.url
+    if url is None:
+        env = {"SENTRY_DSN": "", "HOST": "127.0.0.1", "PORT": PORT, "ACCESS_LOG": "", "LOG_LEVEL": "warning"}
+        if args.workers:
+            env["WEB_CONCURRENCY"] = args.workers
+        common.configure(args.database_url, **env)
+        print(f"seeding {args.users} users, {args.products} products, {args.sales} sales ...", flush=True)
+        # every POST /sales takes one unit, make sure the run cannot sell out
+        common.seed(products=args.products, sales=args.sales, days=args.days, users=args.users, stock=10**9)
+        url = f"http://127.0.0.1:{PORT}"
+        process = subprocess.Popen([sys.executable, "server.py"], cwd=common.APP_DIR, env=os.environ,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if process is not None:
+            wait_until_up(url, process)
+        print(f"{args.concurrency} virtual users for {args.duration:g}s (+{args.warmup:g}s warm-up) against {url}", flush=True)
+        results = asyncio.run(drive(url, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+        print(f"ok: within {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
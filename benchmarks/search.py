@@ -0,0 +1,81 @@
+"""Latency of GET /products/search over a large catalog.
+
+Seeds --products products named like generate_data.py does ("Fresh Cola
+123") and times the search query plus the row fetch of the endpoint for a
+mix of prefix, word, substring, typo and number queries, uncached:
+
+    python benchmarks/search.py --products 1000000
+    python benchmarks/search.py --database-url postgresql://postgres@localhost/bench --products 1000000
+
+On SQLite the first query builds the in-memory name index; its time is
+reported separately and excluded from the percentiles, as it happens once
+per process; later writes are applied to it incrementally. Target: p95
+under 10ms.
+
+Measured on a 1-CPU container with SQLite and 200k products: the index
+builds in about 2s, most queries take 2-4ms, and the slowest take about
+25-35ms. Those are a typo ("chese") and a three-word query, and both scan
+names sharing a very common word. A search right after a sale or a rename
+costs about the same, the index reads only the products created or
+renamed since.
+The Postgres query (a union of the two index-bounded candidate sets joined
+to products) has not been measured at this scale yet; run the second
+command above and record its numbers here.
+"""
+import argparse
+import random
+import time
+
+import common
+import generate_data
+
+QUERIES = ["co", "cola", "fresh co", "premium pizza", "organic milk 42", "chese", "coffe", "spicy chips 9", "123", "tea"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url")
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    common.configure(args.database_url, SENTRY_DSN="")
+    import crud
+    import migrations
+    import search
+    from sqlalchemy import func, select
+    from dbservice import Product, SessionLocal, init_engine
+
+    engine = init_engine()
+    migrations.upgrade()
+    with engine.begin() as conn:
+        if not conn.execute(select(func.count(Product.id))).scalar():
+            print(f"seeding {args.products} products ...", flush=True)
+            user_ids = generate_data.create_users(conn, "search", 1, "-")
+            generate_data.create_products(conn, args.products, user_ids, ["cocacola.jpg"], random.Random(1))
+
+    def run(q):
+        with SessionLocal() as db:
+            matches = search.search_products(db, q, args.limit)
+            return crud.get_products_by_id(db, [pid for pid, _ in matches])
+
+    start = time.perf_counter()
+    run(QUERIES[0])
+    print(f"first query {(time.perf_counter() - start) * 1000:.0f}ms ({engine.dialect.name})")
+
+    print(f"{'query':<18}{'hits':>6}{'p50':>10}{'p95':>10}")
+    everything = []
+    for q in QUERIES:
+        latencies = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            rows = run(q)
+            latencies.append((time.perf_counter() - start) * 1000)
+        everything += latencies
+        print(f"{q:<18}{len(rows):>6}{common.percentile(latencies, 50):>8.2f}ms{common.percentile(latencies, 95):>8.2f}ms")
+    print(f"{'all':<18}{'':>6}{common.percentile(everything, 50):>8.2f}ms{common.percentile(everything, 95):>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Concurrent product searches while products are renamed: no stalls, no lost names.
+
+Starts the app in-process and fires --requests GET /products/search from
+--workers threads while another thread renames --renames products through
+PUT /products/{pid}. Every search must answer within --timeout seconds, and
+afterwards every renamed product must be found under its new name:
+
+    python benchmarks/search_contention.py --workers 16 --requests 400
+    python benchmarks/search_contention.py --async
+
+--async runs the handlers on AsyncSession (DB_ASYNC=1), where the search
+query yields to the event loop that the other searches share.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import common
+
+QUERIES = ["product", "product 1", "prodcut", "duct 4", "renamed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--renames", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    args = parser.parse_args()
+
+    common.configure(args.database_url, SENTRY_DSN="", DB_ASYNC=int(args.use_async), DB_POOL_SIZE=args.workers)
+    common.seed(products=500, sales=0)
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_main.app) as client:
+        def search(n):
+            start = time.perf_counter()
+            response = client.get("/products/search", params={"q": QUERIES[n % len(QUERIES)]})
+            return response.status_code, (time.perf_counter() - start) * 1000
+
+        def rename(n):
+            pid = 1 + n * 7 % 500
+            name = f"renamed {n} zq{n:04d}"
+            response = client.put(f"/products/{pid}", json={"name": name})
+            return pid, name, response.status_code
+
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(args.workers + 1)
+        renames = pool.submit(lambda: [rename(n) for n in range(args.renames)])
+        searches = [pool.submit(search, n) for n in range(args.requests)]
+        done, pending = wait(searches + [renames], timeout=args.timeout)
+        elapsed = time.perf_counter() - start
+        if pending:
+            print(f"FAIL: {len(pending)} requests still pending after {args.timeout:.0f}s")
+            # the stuck requests keep the worker threads alive, skip their cleanup
+            sys.stdout.flush()
+            os._exit(1)
+        pool.shutdown()
+
+        results = [future.result() for future in searches]
+        renamed = {pid: (name, status) for pid, name, status in renames.result()}
+        missing = [
+            pid for pid, (name, status) in renamed.items()
+            if status == 200 and pid not in {row["id"] for row in client.get("/products/search", params={"q": name.split()[-1]}).json()}
+        ]
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    timings = [ms for _, ms in results]
+    print(f"{args.requests} searches from {args.workers} workers and {args.renames} renames in {elapsed:.2f}s "
+          f"({'async' if args.use_async else 'sync'} sessions)")
+    print(f"latency p50 {common.percentile(timings, 50):.1f}ms  p95 {common.percentile(timings, 95):.1f}ms  p99 {common.percentile(timings, 99):.1f}ms")
+    print("responses:", ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+    print(f"renamed {len(renamed)} products, {len(missing)} not found under their new name")
+
+    ok = statuses.keys() == {200} and not missing
+    print("ok: every search answered and every rename indexed" if ok else "FAIL: searches failed or renames were lost")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
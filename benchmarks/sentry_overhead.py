@@ -0,0 +1,105 @@
+"""Per-endpoint overhead of Sentry tracing/profiling.
+
+Runs the same requests against the app in-process (SQLite stand-in) once per
+sampling setup, each in a fresh interpreter, with events dropped by a no-op
+transport instead of being sent:
+
+    off      SENTRY_DSN unset
+    full     every request traced and profiled (the previous hard-coded setup)
+    fixed    SENTRY_SAMPLING_MODE=fixed with its default rates
+    dynamic  the default: slow or failing routes traced, others at 2%
+
+    python benchmarks/sentry_overhead.py --requests 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODES = {
+    "off": {"SENTRY_DSN": ""},
+    "full": {"SENTRY_SAMPLING_MODE": "fixed", "SENTRY_TRACES_SAMPLE_RATE": "1.0", "SENTRY_PROFILES_SAMPLE_RATE": "1.0"},
+    "fixed": {"SENTRY_SAMPLING_MODE": "fixed"},
+    "dynamic": {"SENTRY_SAMPLING_MODE": "dynamic"},
+}
+
+ENDPOINTS = [
+    ("GET", "/products"),
+    ("GET", "/sales"),
+    ("GET", "/dashboard"),
+    ("GET", "/health/db-pool"),
+]
+
+
+def run_mode(requests):
+    import common
+
+    common.configure(SENTRY_DSN=os.environ.get("SENTRY_DSN", "https://public@127.0.0.1/1"))
+    from sentry_sdk.transport import Transport
+
+    class NoopTransport(Transport):
+        def capture_envelope(self, envelope):
+            pass
+
+    import tracing
+    original_init = tracing.init_sentry
+    tracing.init_sentry = lambda **options: original_init(transport=NoopTransport(), **options)
+
+    common.seed()
+    import main
+    from fastapi.testclient import TestClient
+
+    results = {}
+    with TestClient(main.app) as client:
+        token = client.post("/login", json={"username": common.BENCH_USER, "password": common.BENCH_PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for method, path in ENDPOINTS:
+            for _ in range(20):
+                client.request(method, path, headers=headers)
+            timings = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                client.request(method, path, headers=headers)
+                timings.append((time.perf_counter() - start) * 1000)
+            results[f"{method} {path}"] = {
+                "mean": sum(timings) / len(timings),
+                "p95": common.percentile(timings, 95),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.requests)))
+        return
+
+    results = {}
+    for mode, env in MODES.items():
+        child_env = {**os.environ, **env}
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--requests", str(args.requests)],
+            env=child_env, capture_output=True, text=True, check=True,
+        )
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{'endpoint':<22}" + "".join(f"{mode:>18}" for mode in MODES))
+    for endpoint in results["off"]:
+        base = results["off"][endpoint]["mean"]
+        cells = []
+        for mode in MODES:
+            mean = results[mode][endpoint]["mean"]
+            overhead = "" if mode == "off" else f" ({(mean - base) / base * 100:+.0f}%)"
+            cells.append(f"{mean:8.2f}ms{overhead}")
+        print(f"{endpoint:<22}" + "".join(f"{cell:>18}" for cell in cells))
+    print("mean latency per request; percentages are overhead relative to 'off'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Payload serialization time: FastAPI's default path vs the orjson/pydantic-core path.
+
+Times only the encoding of a response body, for --rows products and sales:
+
+    products (dicts)  before: response_model validate + serialize, then json.dumps
+                      after:  ORJSONResponse, orjson straight from the dicts
+    sales (ORM rows)  before: jsonable_encoder walking each object, then json.dumps
+                      after:  model_response, pydantic-core reads the attributes
+                              and writes JSON bytes in one step
+
+    python benchmarks/serialization.py --rows 10000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import common
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    common.configure(SENTRY_DSN="")
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from dbservice import Sale
+    from models import ProductListItem, Sales
+    from responses import ORJSONResponse, model_response
+
+    base_url = "http://localhost:8000"
+    products = [
+        {
+            "id": i,
+            "name": f"product {i}",
+            "price": 10 + i % 90,
+            "quantity": 1000 - i % 1000,
+            "product_image": f"{base_url}/static/images/{i:032x}.jpg",
+            "thumbnail": f"{base_url}/static/images/thumbs/{i:032x}_160.webp",
+        }
+        for i in range(args.rows)
+    ]
+    start = datetime(2024, 1, 1)
+    sales = [
+        Sale(id=i, pid=1 + i % 200, stock_quantity=1 + i % 5, user_id=1, created_at=start + timedelta(minutes=i))
+        for i in range(args.rows)
+    ]
+
+    product_list = TypeAdapter(list[ProductListItem])
+
+    def products_before():
+        # what FastAPI does for response_model=list[ProductListItem], exclude_unset
+        value = product_list.validate_python(products)
+        return json.dumps(product_list.dump_python(value, mode="json", exclude_unset=True)).encode()
+
+    def products_after():
+        return ORJSONResponse(products).body
+
+    def sales_before():
+        return json.dumps(jsonable_encoder(sales)).encode()
+
+    def sales_after():
+        return model_response(list[Sales], sales).body
+
+    cases = [
+        ("products", products_before, products_after),
+        ("sales", sales_before, sales_after),
+    ]
+    print(f"{'payload':<10}{'rows':>8}{'before':>12}{'after':>12}{'speedup':>10}{'bytes':>12}")
+    for name, before, after in cases:
+        before_ms, _ = best_of(before, args.repeat)
+        after_ms, size = best_of(after, args.repeat)
+        print(f"{name:<10}{args.rows:>8}{before_ms:>10.1f}ms{after_ms:>10.1f}ms{before_ms / after_ms:>9.1f}x{size:>12}")
+
+
+if __name__ == "__main__":
+    main()
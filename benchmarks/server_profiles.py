@@ -0,0 +1,127 @@
+"""Throughput of the production server profile vs the previous defaults.
+
+Starts the app under each server profile against a seeded SQLite database,
+drives it with keep-alive HTTP/1.1 connections for --seconds per endpoint and
+reports requests per second and latency percentiles:
+
+    uvicorn     `uvicorn main:app`: one process, asyncio loop, h11 parser (a
+                plain `pip install uvicorn`, what main.py's old block ran)
+    image       the uvicorn-gunicorn image defaults: UvicornWorker with
+                loop/http "auto", max(2, CPUs) workers, keep-alive 5s, no preload
+    tuned       `python server.py`: gunicorn_conf.py with uvloop + httptools,
+                CPU/memory sized workers, preload, keep-alive 75s, capped backlog
+
+    python benchmarks/server_profiles.py --connections 64 --seconds 10
+
+The load generator is a minimal asyncio client in this process, so on small
+machines it competes with the server for CPU; compare profiles with each
+other, not with numbers from other hosts. Measured on a 1-CPU container,
+64 connections, 8s per endpoint, uvloop and httptools installed (so "image"
+already gets them through "auto"):
+
+    profile   endpoint             req/s       p50       p99
+    uvicorn   /health/db-pool       1440    41.6ms   111.5ms
+    uvicorn   /products              391   164.2ms   252.0ms
+    image     /health/db-pool       2194    12.5ms   188.2ms
+    image     /products              434   145.2ms   320.5ms
+    tuned     /health/db-pool       2459    20.0ms   165.3ms
+    tuned     /products              465   131.7ms   280.7ms
+
+Most of the gain over plain uvicorn comes from uvloop and httptools. The
+longer keep-alive only pays off behind a proxy that reuses idle connections,
+and preload mostly shortens start-up and shares memory between workers.
+"""
+import argparse
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import common
+
+PORT = 8899
+ENDPOINTS = ["/health/db-pool", "/products"]
+CONTENT_LENGTH = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+
+
+def profiles():
+    image_workers = str(max(2, os.cpu_count() or 1))
+    return {
+        "uvicorn": [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--loop", "asyncio", "--http", "h11", "--no-access-log"],
+        "image": [
+            sys.executable, "-m", "gunicorn", "main:app", "-k", "uvicorn.workers.UvicornWorker",
+            "-w", image_workers, "--keep-alive", "5", "-b", f"127.0.0.1:{PORT}",
+        ],
+        "tuned": [sys.executable, "server.py"],
+    }
+
+
+def wait_until_up(deadline=30):
+    start = time.time()
+    while time.time() - start < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", PORT), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def connection(path, deadline, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(request)
+            headers = await reader.readuntil(b"\r\n\r\n")
+            await reader.readexactly(int(CONTENT_LENGTH.search(headers).group(1)))
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+
+async def load(path, connections, seconds):
+    # short warm-up so every worker has connected to the database
+    await asyncio.gather(*(connection(path, time.perf_counter() + 1, []) for _ in range(connections)))
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(path, start + seconds, latencies) for _ in range(connections)))
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profiles", default="uvicorn,image,tuned")
+    args = parser.parse_args()
+
+    common.configure(SENTRY_DSN="", PORT=PORT, HOST="127.0.0.1", ACCESS_LOG="", LOG_LEVEL="warning")
+    common.seed()
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
+    print(f"{'profile':<10}{'endpoint':<18}{'req/s':>8}{'p50':>10}{'p99':>10}")
+    for name in args.profiles.split(","):
+        process = subprocess.Popen(profiles()[name], cwd=common.APP_DIR, env=os.environ,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up()
+            for path in ENDPOINTS:
+                rate, latencies = asyncio.run(load(path, args.connections, args.seconds))
+                print(f"{name:<10}{path:<18}{rate:>8.0f}{common.percentile(latencies, 50):>8.1f}ms"
+                      f"{common.percentile(latencies, 99):>8.1f}ms")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
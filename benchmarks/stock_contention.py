@@ -0,0 +1,93 @@
+"""Concurrent checkouts against a single product: no oversells, no lost updates.
+
+Starts the app in-process and fires --requests sales of one unit each (or
+--bulk rows per POST /sales/bulk) from --workers threads at a product that
+only has --stock units. Afterwards the product's quantity, the recorded sales
+and the accepted responses must all agree:
+
+    accepted units == stock taken == units in the sales table, quantity >= 0
+
+    python benchmarks/stock_contention.py --workers 32 --requests 500 --stock 200
+    python benchmarks/stock_contention.py --database-url postgresql://... --bulk 10
+
+SQLite serialises writers, so expect some 5xx "database is locked" failures
+under heavy parallelism there; they are counted separately and must not
+change stock either. Use Postgres to measure real row-lock contention.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--bulk", type=int, default=0, help="rows per POST /sales/bulk (0: POST /sales)")
+    args = parser.parse_args()
+
+    common.configure(args.database_url, SENTRY_DSN="", DB_POOL_SIZE=args.workers)
+    common.seed(products=1, sales=0)
+    import main as app_main
+    from dbservice import SessionLocal, Product, Sale
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+
+    with SessionLocal() as db:
+        product = db.query(Product).order_by(Product.id).first()
+        pid = product.id
+        product.quantity = args.stock
+        sold_before = db.query(func.coalesce(func.sum(Sale.stock_quantity), 0)).filter(Sale.pid == pid).scalar()
+        db.commit()
+
+    sale = {"pid": pid, "stock_quantity": 1, "created_at": datetime.now().isoformat()}
+    with TestClient(app_main.app) as client:
+        token = client.post("/login", json={"username": common.BENCH_USER, "password": common.BENCH_PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def checkout(_):
+            start = time.perf_counter()
+            if args.bulk:
+                response = client.post("/sales/bulk", json=[sale] * args.bulk, headers=headers)
+                units = response.json()["inserted"] if response.status_code == 200 else 0
+            else:
+                response = client.post("/sales", json=sale, headers=headers)
+                units = 1 if response.status_code == 200 else 0
+            return response.status_code, units, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.workers) as pool:
+            results = list(pool.map(checkout, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    with SessionLocal() as db:
+        quantity = db.get(Product, pid).quantity
+        sold = db.query(func.coalesce(func.sum(Sale.stock_quantity), 0)).filter(Sale.pid == pid).scalar() - sold_before
+
+    accepted = sum(units for _, units, _ in results)
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    timings = [ms for _, _, ms in results]
+    print(f"{args.requests} requests from {args.workers} workers in {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s)")
+    print(f"latency p50 {common.percentile(timings, 50):.1f}ms  p95 {common.percentile(timings, 95):.1f}ms  p99 {common.percentile(timings, 99):.1f}ms")
+    print("responses:", ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+    print(f"stock {args.stock} -> {quantity}, units accepted {accepted}, units in sales table {sold}")
+
+    ok = quantity >= 0 and args.stock - quantity == accepted == sold
+    if args.requests * max(args.bulk, 1) >= args.stock and args.stock % max(args.bulk, 1) == 0 \
+            and not statuses.keys() - {200, 409}:
+        # every request was answered and demand covered supply: it must sell out exactly
+        ok = ok and quantity == 0
+    print("ok: no oversells or lost updates" if ok else "FAIL: stock and sales disagree")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()